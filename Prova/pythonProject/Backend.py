@@ -1,64 +1,385 @@
-from pyspark.ml.feature import Tokenizer, StopWordsRemover
+import atexit
+import builtins
+import copy
+import os
+import shutil
+import threading
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
 from pyspark.sql import SparkSession
-from pyspark.sql.functions import (regexp_replace, split, expr, col, to_date, regexp_extract, udf, count,
+from pyspark.sql.functions import (regexp_replace, split, expr, col, regexp_extract, udf, count,
                                    avg, sum, when, first, concat, max, min, countDistinct, explode, lower, lit, year,
-                                   month)
+                                   month, array_position, array_contains, element_at, transform, trim, struct,
+                                   variance, monotonically_increasing_id)
 from pyspark.sql.types import IntegerType, FloatType, StringType
 
-from Utility import PATH_DS, estraiCitta
+from Encoding import COLD_COLUMNS, DatasetDictionaries, tipoTesto
+from Geo import HotelSpatialIndex, loadMonuments
+from Profiling import QueryProfiler
+from ResultCache import ResultCache, risultatoInCache
+from Schema import CORRUPT_COLUMN, OPZIONI_CSV, SCHEMA_RECENSIONI, leggiRecensioni, riportaRigheMalformate
+from SearchIndex import ReviewSearchIndex, calcolaIndiceRicerca
+from Sentiment import loadSparkModel, scoreDataset
+from Sketches import DatasetSketches, calcolaSketch
+from Transfer import iterChunks, perMappa, toPandasLimitato
+from Utility import (PATH_DS, PATH_SNAPSHOT, PATH_DROP, WORD_INDEX_DIR, SCORED_DIR, CHECKPOINT_DIR, RESULTS_DIR,
+                     INGESTION_TRIGGER, FINGERPRINT_KEYS, SNAPSHOT_PARTITIONS, WORDCLOUD_SIZE, PROFILING_ENV,
+                     PROFILING_LOG, APP_NAME, FAIR_SCHEDULER_FILE, SCHEDULER_POOL, INGESTION_POOL, estraiCitta,
+                     QUERY_ENGINE, ARROW_BATCH_ROWS, DRIVER_MAX_RESULT_SIZE, CHART_MAX_POINTS,
+                     TRANSFER_TRAINING_MAX_BYTES, dataset_fingerprint, read_fingerprint, is_snapshot_valid,
+                     write_fingerprint, get_stop_words, APPROXIMATE_MODE, SKETCHES_DIR, SKETCH_Z, SAMPLE_FRACTION,
+                     SAMPLE_MIN_ROWS, REVIEW_ID, DICTIONARIES_DIR, COLD_LOOKUP_MAX_IDS, SEARCH_INDEX_DIR,
+                     SEARCH_LIMIT, QUERY_THREADS, INGESTION_ENABLED, STAGING_DIR)
+
+
+# Versione nativa di Utility.estraiCitta: stessa logica, ma eseguita dalla JVM senza passare ogni riga a Python
+def estraiCittaColumn(indirizzo="Hotel_Address", country="Country_Hotel"):
+    tokens = split(col(indirizzo), " ")
+    is_uk = col(country) == "United Kingdom"
+    posizione = when(is_uk, array_position(tokens, "Kingdom")) \
+        .otherwise(expr(f"array_position(split({indirizzo}, ' '), {country})"))
+    # Per il Regno Unito la città si trova 4 parole prima (6 se il CAP contiene 6BD)
+    distanza = when(is_uk, when(array_contains(tokens, "6BD"), 6).otherwise(4)).otherwise(1)
+    # Indice 0-based come in Python: se è negativo si conta dalla fine, come fa list[-n]
+    indice = posizione - 1 - distanza
+    return when(posizione == 0, lit(None)) \
+        .when(indice >= 0, element_at(tokens, indice + 1)) \
+        .otherwise(element_at(tokens, indice))
+
+
+# Confronta la versione nativa con la UDF originale e restituisce le righe in cui differiscono
+def confrontaEstrazioneCitta(dataset):
+    def estraiCittaSicura(indirizzo, country):
+        # La funzione originale solleva un'eccezione se lo stato non è nell'indirizzo, la nativa restituisce null
+        try:
+            return estraiCitta(indirizzo, country)
+        except (ValueError, IndexError, AttributeError):
+            return None
+
+    udf_estraiCitta = udf(estraiCittaSicura, StringType())
+    df = dataset.select("Hotel_Address", "Country_Hotel").distinct()
+    df = df.select("Hotel_Address", "Country_Hotel",
+                   udf_estraiCitta(col("Hotel_Address"), col("Country_Hotel")).alias("City_UDF"),
+                   estraiCittaColumn().alias("City_Native"))
+    return df.filter(~col("City_UDF").eqNullSafe(col("City_Native")))
+
+
+# Stagione di un mese, come colonna Spark e come funzione Python per le stime sui campioni
+def stagione(mese):
+    return when((mese >= 3) & (mese <= 5), "Spring") \
+        .when((mese >= 6) & (mese <= 8), "Summer") \
+        .when((mese >= 9) & (mese <= 11), "Autumn") \
+        .otherwise("Winter")
+
+
+def stagioneMese(mese):
+    if 3 <= mese <= 5:
+        return "Spring"
+    if 6 <= mese <= 8:
+        return "Summer"
+    if 9 <= mese <= 11:
+        return "Autumn"
+    return "Winter"
+
+
+# Livelli (grouping_id) dell'archivio di aggregati costruito da calcolaAggregati
+LIVELLO_HOTEL_MESE = 1
+LIVELLO_NAZIONALITA = 14
+
+
+# Un'unica scansione del dataset con GROUPING SETS: statistiche additive per (città, hotel, anno, mese)
+# e coppie distinte (città, nazionalità). Le query del QueryManager ricavano i risultati da questa tabella.
+# Lavora sul dataset caldo: raggruppa per codici interi e usa i tipi di testo al posto delle recensioni
+def calcolaAggregati(dataset):
+    dataset.createOrReplaceTempView("recensioni_aggregati")
+    return dataset.sparkSession.sql("""
+        SELECT City_Hotel, Hotel_Name, Review_Year, Review_Month, Reviewer_Nationality,
+               grouping_id() AS Livello,
+               count(*) AS Total_Reviews,
+               sum(Average_Score) AS Sum_Average_Score,
+               count(Average_Score) AS Count_Average_Score,
+               sum(CASE WHEN Negative_Kind IN (0, 1) THEN 0 ELSE 1 END) AS TotalN,
+               sum(CASE WHEN Positive_Kind IN (0, 1) THEN 0 ELSE 1 END) AS TotalP,
+               sum(CASE WHEN Positive_Kind != 0 THEN 1 ELSE 0 END) AS Total_Positive_Reviews,
+               sum(CASE WHEN Negative_Kind != 0 THEN 1 ELSE 0 END) AS Total_Negative_Reviews,
+               max(Reviewer_Score) AS Max_Reviewer_Score,
+               min(Reviewer_Score) AS Min_Reviewer_Score,
+               sum(Reviewer_Score) AS Sum_Reviewer_Score,
+               count(Reviewer_Score) AS Count_Reviewer_Score,
+               first(lat) AS Latitude,
+               first(lng) AS Longitude,
+               sum(Additional_Number_of_Scoring) AS Sum_Additional_Number_of_Scoring,
+               count(Additional_Number_of_Scoring) AS Count_Additional_Number_of_Scoring,
+               sum(Review_Total_Negative_Word_Counts) AS Sum_Negative_Words,
+               count(Review_Total_Negative_Word_Counts) AS Count_Negative_Words,
+               sum(Review_Total_Positive_Word_Counts) AS Sum_Positive_Words,
+               count(Review_Total_Positive_Word_Counts) AS Count_Positive_Words
+        FROM recensioni_aggregati
+        GROUP BY City_Hotel, Hotel_Name, Review_Year, Review_Month, Reviewer_Nationality
+        GROUPING SETS ((City_Hotel, Hotel_Name, Review_Year, Review_Month), (City_Hotel, Reviewer_Nationality))
+    """)
+
+
+# Somma all'archivio esistente gli aggregati di un nuovo batch: tutte le statistiche salvate sono additive
+def unisciAggregati(aggregati, nuovi):
+    chiavi = ["City_Hotel", "Hotel_Name", "Review_Year", "Review_Month", "Reviewer_Nationality", "Livello"]
+    colonne = []
+    for c in aggregati.columns:
+        if c in chiavi:
+            continue
+        if c.startswith("Max_"):
+            colonne.append(max(c).alias(c))
+        elif c.startswith("Min_"):
+            colonne.append(min(c).alias(c))
+        elif c in ("Latitude", "Longitude"):
+            colonne.append(first(c, ignorenulls=True).alias(c))
+        else:
+            colonne.append(sum(c).alias(c))
+    return aggregati.unionByName(nuovi).groupBy(*chiavi).agg(*colonne)
+
+
+# Sposta in path i file Parquet di un batch scritti in staging, con il numero del batch nel nome. I file lasciati
+# da un tentativo precedente dello stesso batch (interrotto prima del fingerprint) vengono rimossi prima:
+# un batch riproposto da Spark dopo un crash non duplica le righe
+def pubblicaBatch(staging, path, numero):
+    prefisso = f"batch{numero}-"
+    for cartella, sottocartelle, files in os.walk(path):
+        # Le strutture derivate dentro lo snapshot hanno i propri batch
+        sottocartelle[:] = [d for d in sottocartelle if not d.startswith(("_", "."))]
+        for nome in files:
+            if nome.startswith(prefisso):
+                os.remove(os.path.join(cartella, nome))
+    for cartella, _, files in os.walk(staging):
+        destinazione = os.path.normpath(os.path.join(path, os.path.relpath(cartella, staging)))
+        for nome in files:
+            if nome.endswith(".parquet"):
+                os.makedirs(destinazione, exist_ok=True)
+                os.replace(os.path.join(cartella, nome), os.path.join(destinazione, prefisso + nome))
+    shutil.rmtree(staging, ignore_errors=True)
+
+
+# Conteggio delle parole delle recensioni per (parola, città, anno): tutte le statistiche sulle parole partono da qui
+def calcolaIndiceParole(dataset):
+    words = dataset.select(
+        "City_Hotel", "Review_Year",
+        explode(split(lower(concat(col("Negative_Review"), lit(" "), col("Positive_Review"))), r"\s+")).alias("word"))
+    return words.groupBy("word", "City_Hotel", "Review_Year").agg(count("*").alias("Frequency"))
 
 
 class SparkBuilder:
 
-    def __init__(self, appname):
+    def __init__(self, appname, path=PATH_DS, validate=False, snapshot=PATH_SNAPSHOT, profile=None):
         self.spark = (SparkSession.builder.master("local[*]").
-                      appName(appname).getOrCreate())
-        self.dataset = self.spark.read.csv(PATH_DS, header=True, inferSchema=True)
-        self.castDataset()
-
-    def castDataset(self):
-        df = self.dataset
-        #Effettuaiamo il cast di qualche colonna
-        df = df.withColumn("Additional_Number_of_Scoring", df["Additional_Number_of_Scoring"].cast(IntegerType()))
-        df = df.withColumn("Review_Date", to_date(df["Review_Date"], "M/d/yyyy"))
-        df = df.withColumn("Average_Score", df["Average_Score"].cast(FloatType()))
-        df = df.withColumn("Review_Total_Negative_Word_Counts", df["Review_Total_Negative_Word_Counts"] \
-                           .cast(IntegerType()))
-        df = df.withColumn("Total_Number_of_Reviews", df["Total_Number_of_Reviews"].cast(IntegerType()))
-        df = df.withColumn("Review_Total_Positive_Word_Counts", df["Review_Total_Positive_Word_Counts"] \
-                           .cast(IntegerType()))
-        df = df.withColumn("Total_Number_of_Reviews_Reviewer_Has_Given",
-                           df["Total_Number_of_Reviews_Reviewer_Has_Given"].cast(IntegerType()))
-        df = df.withColumn("Reviewer_Score", df["Reviewer_Score"].cast(FloatType()))
-        df = df.withColumn("Review_Year", year(df["Review_Date"]))
-        df = df.withColumn("Review_Month", month(df["Review_Date"]))
-        df = df.withColumn("days_since_review",
-                           regexp_extract(col("days_since_review"), r"(\d+)", 1).cast(IntegerType()))
-
-        df = df.withColumn("lat", df["lat"].cast(FloatType()))
-        df = df.withColumn("lng", df["lng"].cast(FloatType()))
-
-        #Convertiamo i tag in un array di stringhe
-        df = df.withColumn("Tags", regexp_replace(col("Tags"), "[\[\]']", ""))
-        df = df.withColumn("Tags", split(col("Tags"), ", "))
-        df = df.withColumn("Tags", expr("transform(Tags, x -> trim(x))"))
-
-        # Aggiunta di due colonne per facilitare le query:
-        #Country_Hotel rappresenta la nazionalità dell'hotel
-        df = df.withColumn("Country_Hotel",
-                           regexp_extract(col("Hotel_Address"), r'(United\s+Kingdom|\b[A-Z][a-z]+)$', 1))
-
-        udf_estraiCitta = udf(estraiCitta, StringType())
-        #City_Hotel rappresenta la città dove è ubicato l'hotel
-        df = df.withColumn("City_Hotel", udf_estraiCitta(col("Hotel_Address"), col("Country_Hotel")))
+                      appName(appname).
+                      config("spark.sql.execution.arrow.pyspark.enabled", "true").
+                      config("spark.sql.execution.arrow.maxRecordsPerBatch", ARROW_BATCH_ROWS).
+                      config("spark.driver.maxResultSize", DRIVER_MAX_RESULT_SIZE).
+                      config("spark.scheduler.mode", "FAIR").
+                      config("spark.scheduler.allocation.file", FAIR_SCHEDULER_FILE).getOrCreate())
+        self.path = path
+        self.snapshot = snapshot
+        self.validate = validate
+        self.malformed = 0
+        self.ingestion = None
+        self.closed = False
+        # La strumentazione delle query è opzionale: parametro esplicito o variabile d'ambiente
+        if profile is None:
+            profile = os.environ.get(PROFILING_ENV, "") not in ("", "0")
+        self.profiler = QueryProfiler(self.spark, PROFILING_LOG) if profile else None
+        self.loadDataset()
+
+    def loadDataset(self):
+        self.fingerprint = dataset_fingerprint(self.path)
+        if is_snapshot_valid(self.snapshot, self.fingerprint):
+            # Il CSV non è cambiato: leggiamo direttamente lo snapshot già pulito (con i batch già aggiunti)
+            self.fingerprint = read_fingerprint(self.snapshot)
+        else:
+            # Lo schema è dichiarato: nessun passaggio extra sul file per inferire i tipi
+            raw = leggiRecensioni(self.spark, self.path, self.validate)
+            if self.validate:
+                raw = raw.cache()
+                self.malformed = riportaRigheMalformate(raw)
+            # Review_Id collega le colonne calde in cache ai testi che restano nello snapshot
+            self.saveSnapshot(self.castDataset(raw.drop(CORRUPT_COLUMN))
+                              .withColumn(REVIEW_ID, monotonically_increasing_id()))
+            raw.unpersist()
+
+        # In cache va solo il dataset caldo: codici interi e colonne numeriche, senza i testi delle recensioni.
+        # self.dataset è la sua vista con i nomi in chiaro, per le query che non hanno bisogno dei testi
+        self.dictionaries = self.loadDictionaries()
+        self.hot = self.dictionaries.encode(self.fullDataset()).cache()
+        self.dataset = self.dictionaries.decode(self.hot)
+        self.query = QueryManager(self)
+        if self.profiler is not None:
+            self.profiler.instrument(self.query)
+
+    # Percorso di una struttura derivata (indice, checkpoint, ...) salvata dentro lo snapshot
+    def snapshotPath(self, name):
+        return os.path.join(self.snapshot, name)
+
+    def saveSnapshot(self, dataset):
+        dataset.write.mode("overwrite").partitionBy(*SNAPSHOT_PARTITIONS).parquet(self.snapshot)
+        # Il fingerprint viene scritto per ultimo, così uno snapshot incompleto non risulta mai valido
+        write_fingerprint(self.snapshot, self.fingerprint)
+
+    # Dizionari salvati nello snapshot, ricalcolati se non sono allineati alla versione del dataset
+    def loadDictionaries(self):
+        path = self.snapshotPath(DICTIONARIES_DIR)
+        if is_snapshot_valid(path, self.fingerprint, FINGERPRINT_KEYS + ("batches",)):
+            try:
+                return DatasetDictionaries.load(path)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Dizionari da ricalcolare: {e}")
+        dictionaries = DatasetDictionaries.build(self.fullDataset())
+        dictionaries.save(path)
+        write_fingerprint(path, self.fingerprint)
+        return dictionaries
+
+    # Snapshot completo, con testi e nomi in chiaro: per le strutture derivate calcolate una volta sola
+    def fullDataset(self):
+        return self.spark.read.parquet(self.snapshot)
+
+    # Tabella fredda: i testi per Review_Id, letti dallo snapshot (solo le colonne richieste) e mai messi in cache
+    def coldTable(self, *columns):
+        return self.fullDataset().select(REVIEW_ID, *(columns or COLD_COLUMNS))
+
+    # Aggiunge i testi alle righe (poche) di una query sul dataset caldo: il filtro sugli id arriva fino ai
+    # file Parquet, dove Review_Id è crescente e le statistiche dei row group saltano quasi tutto lo snapshot
+    def fetchText(self, rows, *columns):
+        ids = [row[0] for row in rows.select(REVIEW_ID).limit(COLD_LOOKUP_MAX_IDS + 1).collect()]
+        cold = self.coldTable(*columns)
+        if len(ids) <= COLD_LOOKUP_MAX_IDS:
+            cold = cold.filter(col(REVIEW_ID).isin(ids))
+        return rows.join(cold, REVIEW_ID)
+
+    # Avvia la lettura in streaming della cartella di drop: ogni nuovo file passa da castDataset e viene aggiunto
+    def startIngestion(self, path=PATH_DROP, trigger=INGESTION_TRIGGER):
+        if self.ingestion is None:
+            # Lo streaming su file richiede che la cartella esista già
+            os.makedirs(path, exist_ok=True)
+            stream = self.spark.readStream.options(**OPZIONI_CSV).schema(SCHEMA_RECENSIONI).csv(path)
+            # La query di streaming eredita il pool del thread che la avvia
+            sc = self.spark.sparkContext
+            previous = sc.getLocalProperty("spark.scheduler.pool")
+            sc.setLocalProperty("spark.scheduler.pool", INGESTION_POOL)
+            try:
+                self.ingestion = (stream.writeStream.foreachBatch(self.ingestBatch)
+                                  .option("checkpointLocation", self.snapshotPath(CHECKPOINT_DIR))
+                                  .trigger(processingTime=trigger)
+                                  .start())
+            finally:
+                sc.setLocalProperty("spark.scheduler.pool", previous)
+        return self.ingestion
+
+    def stopIngestion(self):
+        if self.ingestion is not None:
+            self.ingestion.stop()
+            self.ingestion = None
+
+    def ingestBatch(self, batch, batch_id):
+        # Dopo un riavvio Spark può riproporre l'ultimo batch: lo scartiamo se è già nello snapshot
+        if batch_id <= self.fingerprint.get("last_batch_id", -1):
+            return
+        numero = self.fingerprint.get("batches", 0) + 1
+        # Gli id di ogni batch partono da numero << 48: monotonically_increasing_id resta sotto 2^48
+        # finché il batch ha meno di 2^15 partizioni, quindi non si sovrappongono a quelli già assegnati
+        batch = self.castDataset(batch) \
+            .withColumn(REVIEW_ID, monotonically_increasing_id() + lit(numero << 48)).cache()
+        if batch.count() > 0:
+            self.appendBatch(self.snapshot, numero,
+                             lambda staging: batch.write.partitionBy(*SNAPSHOT_PARTITIONS).parquet(staging))
+            fingerprint = dict(self.fingerprint, batches=numero, last_batch_id=batch_id)
+
+            # Le pagine continuano a usare dizionari, dataset e strutture attuali finché non vengono sostituiti
+            # tutti insieme sotto il lock: i nuovi si preparano su copie
+            path = self.snapshotPath(DICTIONARIES_DIR)
+            dictionaries = copy.deepcopy(self.dictionaries).extend(batch)
+            dictionaries.save(path)
+            write_fingerprint(path, fingerprint)
+
+            # Il nuovo dataset caldo si rilegge dallo snapshot che contiene già il batch, come all'avvio:
+            # non dipende né dal dataset precedente né dal DataFrame del micro-batch
+            hot = dictionaries.encode(self.fullDataset()).cache()
+            hot.count()
+            nuove = self.query.aggiornaConBatch(batch, dictionaries, numero, fingerprint)
+
+            with self.query.lock:
+                previous = [self.hot, *self.query.sostituisci(nuove)]
+                self.dictionaries = dictionaries
+                self.hot = hot
+                self.dataset = dictionaries.decode(hot)
+                self.fingerprint = fingerprint
+                # Il fingerprint conferma il batch: da qui in poi un suo nuovo arrivo viene scartato
+                write_fingerprint(self.snapshot, self.fingerprint)
+            for df in previous:
+                df.unpersist()
+        batch.unpersist()
+
+    # Scrive un batch (con scrivi(cartella)) nella cartella di appoggio e ne pubblica i file in path
+    def appendBatch(self, path, numero, scrivi):
+        staging = self.snapshotPath(STAGING_DIR)
+        shutil.rmtree(staging, ignore_errors=True)
+        scrivi(staging)
+        pubblicaBatch(staging, path, numero)
+
+    def castDataset(self, df):
+        # I tipi base arrivano già dallo schema: tutte le colonne derivate vengono aggiunte in un'unica proiezione
+        df = df.select(
+            "Hotel_Address", "Additional_Number_of_Scoring", "Review_Date", "Average_Score", "Hotel_Name",
+            "Reviewer_Nationality", "Negative_Review", "Review_Total_Negative_Word_Counts",
+            "Total_Number_of_Reviews", "Positive_Review", "Review_Total_Positive_Word_Counts",
+            "Total_Number_of_Reviews_Reviewer_Has_Given", "Reviewer_Score",
+            #Convertiamo i tag in un array di stringhe
+            transform(split(regexp_replace(col("Tags"), r"[\[\]']", ""), ", "), lambda x: trim(x)).alias("Tags"),
+            regexp_extract(col("days_since_review"), r"(\d+)", 1).cast(IntegerType()).alias("days_since_review"),
+            col("lat").cast(FloatType()).alias("lat"),
+            col("lng").cast(FloatType()).alias("lng"),
+            year(col("Review_Date")).alias("Review_Year"),
+            month(col("Review_Date")).alias("Review_Month"),
+            # Aggiunta di due colonne per facilitare le query:
+            #Country_Hotel rappresenta la nazionalità dell'hotel
+            regexp_extract(col("Hotel_Address"), r'(United\s+Kingdom|\b[A-Z][a-z]+)$', 1).alias("Country_Hotel"),
+            # Tipo dei due testi: il dataset caldo e il motore pandas li leggono senza leggere i testi
+            tipoTesto("Negative_Review", "No Negative").alias("Negative_Kind"),
+            tipoTesto("Positive_Review", "No Positive").alias("Positive_Kind")
+        )
+
+        #City_Hotel rappresenta la città dove è ubicato l'hotel (Spark la fonde con la proiezione precedente)
+        df = df.withColumn("City_Hotel", estraiCittaColumn("Hotel_Address", "Country_Hotel"))
 
         # dataset dannaggiato
         df = df.filter(col("lat").isNotNull() & col("lat").isNotNull() & (~col("Reviewer_Nationality").like(" ")))
 
-        self.dataset = df.cache()
-        self.query = QueryManager(self)
+        return df
+
+    # Materializza subito la cache del dataset e le strutture usate da tutte le pagine
+    def warmUp(self):
+        self.rows = self.hot.count()
+        self.query.getAggregati().count()
+        self.query.getCatalog()
+        self.query.getIndiceParole().count()
+        return self.rows
+
+    def healthCheck(self):
+        alive = not self.closed and not self.spark.sparkContext._jsc.sc().isStopped()
+        return {
+            "alive": alive,
+            "dataset_cached": alive and self.hot.is_cached,
+            "rows": getattr(self, "rows", None),
+            "version": f"{self.fingerprint['sha256'][:12]}+{self.fingerprint.get('batches', 0)}",
+            "ingestion": self.ingestion is not None and self.ingestion.isActive,
+            "malformed": self.malformed,
+        }
 
     def closeConnection(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.stopIngestion()
         self.spark.stop()
         print("Connessione Chiusa")
 
@@ -66,101 +387,297 @@ class SparkBuilder:
 class QueryManager:
     def __init__(self, spark: SparkBuilder):
         self.spark = spark
+        self.aggregati = None
+        self.indiceParole = None
+        self.profili = None
+        self.catalogo = None
+        self.indiceNomi = None
+        self.indiceSpaziale = None
+        self.risultati = None
+        self.sketch = None
+        self.indiceRicerca = None
+        # Le pagine lanciano più query insieme: le strutture condivise si costruiscono una volta sola
+        self.lock = threading.RLock()
+        # In modalità approssimata conteggi distinti, classifiche e stagioni usano sketch e campioni
+        self.approssimato = APPROXIMATE_MODE
+
+    # Cache dei risultati condivisa da tutte le sessioni, allineata alla versione del dataset a ogni chiamata
+    def getResultCache(self):
+        with self.lock:
+            if self.risultati is None:
+                self.risultati = ResultCache(self.spark.snapshotPath(RESULTS_DIR))
+        return self.risultati
+
+    # Archivio degli aggregati, calcolato alla prima richiesta e tenuto in cache
+    def getAggregati(self):
+        with self.lock:
+            if self.aggregati is None:
+                # Il raggruppamento avviene sui codici: si decodificano soltanto le righe aggregate
+                self.aggregati = self.spark.dictionaries.decode(calcolaAggregati(self.spark.hot)).cache()
+        return self.aggregati
+
+    def getAggregatiHotelMese(self):
+        return self.getAggregati().filter(col("Livello") == LIVELLO_HOTEL_MESE)
+
+    # Una struttura salvata nello snapshot è valida se è allineata anche ai batch aggiunti dallo streaming
+    def isDerivedValid(self, path):
+        return is_snapshot_valid(path, self.spark.fingerprint, FINGERPRINT_KEYS + ("batches",))
+
+    # Indice delle parole, ricostruito solo quando cambia la versione del dataset
+    def getIndiceParole(self):
+        with self.lock:
+            if self.indiceParole is None:
+                path = self.spark.snapshotPath(WORD_INDEX_DIR)
+                if not self.isDerivedValid(path):
+                    calcolaIndiceParole(self.spark.fullDataset()).write.mode("overwrite").parquet(path)
+                    write_fingerprint(path, self.spark.fingerprint)
+                self.indiceParole = self.spark.spark.read.parquet(path).cache()
+        return self.indiceParole
+
+    # Sketch (HyperLogLog e top-k) costruiti con un solo passaggio sul dataset e salvati nello snapshot
+    def getSketches(self):
+        with self.lock:
+            if self.sketch is None:
+                path = self.spark.snapshotPath(SKETCHES_DIR)
+                if self.isDerivedValid(path):
+                    self.sketch = DatasetSketches.load(path)
+                else:
+                    self.sketch = calcolaSketch(self.spark.fullDataset())
+                    self.sketch.save(path)
+                    write_fingerprint(path, self.spark.fingerprint)
+        return self.sketch
+
+    # Indice invertito per la ricerca full-text, costruito una volta con Spark e poi interrogato senza Spark
+    def getSearchIndex(self):
+        with self.lock:
+            if self.indiceRicerca is None:
+                path = self.spark.snapshotPath(SEARCH_INDEX_DIR)
+                if not self.isDerivedValid(path):
+                    calcolaIndiceRicerca(self.spark.fullDataset(), path)
+                    write_fingerprint(path, self.spark.fingerprint)
+                self.indiceRicerca = ReviewSearchIndex(path, self.spark.snapshot)
+        return self.indiceRicerca
+
+    # Aggiorna aggregati e indice delle parole con le sole righe nuove, senza rileggere lo storico
+    # Aggiorna con un batch già pubblicato nello snapshot le strutture derivate: quelle su disco subito, quelle
+    # in memoria vengono restituite e sostituite con sostituisci() sotto il lock, insieme al dataset caldo
+    def aggiornaConBatch(self, batch, dictionaries, numero, fingerprint):
+        with self.lock:
+            aggregati, indiceParole, sketch = self.aggregati, self.indiceParole, self.sketch
+        nuove = {"indiceRicerca": None, "profili": None, "catalogo": None, "indiceNomi": None,
+                 "indiceSpaziale": None}
+
+        if aggregati is not None:
+            nuovi = dictionaries.decode(calcolaAggregati(dictionaries.encode(batch)))
+            # localCheckpoint materializza il risultato e ne taglia la lineage: non dipende più dal batch
+            nuove["aggregati"] = unisciAggregati(aggregati, nuovi).localCheckpoint()
+
+        # I conteggi sono additivi: basta aggiungere le righe del batch all'indice salvato
+        path = self.spark.snapshotPath(WORD_INDEX_DIR)
+        if self.isDerivedValid(path):
+            self.spark.appendBatch(path, numero, lambda staging: calcolaIndiceParole(batch).write.parquet(staging))
+            write_fingerprint(path, fingerprint)
+            if indiceParole is not None:
+                nuove["indiceParole"] = self.spark.spark.read.parquet(path).cache()
+        else:
+            nuove["indiceParole"] = None
+
+        # Gli sketch sono unibili: quelli del batch si aggiungono a una copia di quelli salvati
+        path = self.spark.snapshotPath(SKETCHES_DIR)
+        if self.isDerivedValid(path):
+            nuove["sketch"] = copy.deepcopy(sketch or DatasetSketches.load(path)).merge(calcolaSketch(batch))
+            nuove["sketch"].save(path)
+            write_fingerprint(path, fingerprint)
+        else:
+            nuove["sketch"] = None
+
+        # Le recensioni nuove hanno id nuovi: i loro postings e documenti si aggiungono all'indice di ricerca
+        path = self.spark.snapshotPath(SEARCH_INDEX_DIR)
+        if self.isDerivedValid(path):
+            self.spark.appendBatch(path, numero, lambda staging: calcolaIndiceRicerca(batch, staging))
+            write_fingerprint(path, fingerprint)
+
+        # Il batch viene classificato una volta sola e aggiunto alle recensioni già classificate
+        path = self.spark.snapshotPath(SCORED_DIR)
+        if self.isDerivedValid(path):
+            scored = scoreDataset(batch, loadSparkModel(fingerprint))
+            self.spark.appendBatch(path, numero,
+                                   lambda staging: scored.write.partitionBy(*SNAPSHOT_PARTITIONS).parquet(staging))
+            write_fingerprint(path, fingerprint)
+        return nuove
+
+    # Sostituisce le strutture in memoria con quelle preparate da aggiornaConBatch. Va chiamato con il lock;
+    # restituisce i DataFrame in cache sostituiti, da rilasciare dopo
+    def sostituisci(self, nuove):
+        precedenti = [getattr(self, nome) for nome in ("aggregati", "indiceParole") if nome in nuove]
+        for nome, valore in nuove.items():
+            setattr(self, nome, valore)
+        return [df for df in precedenti if df is not None]
+
+    # Catalogo Country_Hotel -> City_Hotel -> [Hotel_Name], calcolato con un'unica distinct e condiviso dalle pagine
+    def getCatalog(self):
+        with self.lock:
+            if self.catalogo is None:
+                righe = self.righeCatalogo()
+                catalogo = {}
+                for row in righe:
+                    cities = catalogo.setdefault(row["Country_Hotel"], {})
+                    cities.setdefault(row["City_Hotel"], []).append(row["Hotel_Name"])
+                for cities in catalogo.values():
+                    for hotels in cities.values():
+                        hotels.sort()
+                # Nomi in minuscolo ordinati, per la ricerca per prefisso con bisect
+                self.indiceNomi = sorted((row["Hotel_Name"].lower(), row["Hotel_Name"], row["Country_Hotel"],
+                                          row["City_Hotel"]) for row in righe)
+                self.catalogo = catalogo
+        return self.catalogo
+
+    # Terne distinte (Country_Hotel, City_Hotel, Hotel_Name) da cui si costruisce il catalogo
+    def righeCatalogo(self):
+        terne = self.spark.hot.select("Country_Hotel", "City_Hotel", "Hotel_Name") \
+            .filter(col("Hotel_Name").isNotNull()).distinct()
+        return self.spark.dictionaries.decode(terne).collect()
 
     def getCountryHotel(self):
-        return self.spark.dataset.select(col("Country_Hotel").alias("Country_Hotel")).distinct().collect()
+        return sorted(self.getCatalog(), key=str)
 
     def getCityHotel(self):
-        return self.spark.dataset.select(col("City_Hotel").alias("City_Hotel")).distinct().collect()
+        return sorted({city for cities in self.getCatalog().values() for city in cities}, key=str)
 
     def getHotelName(self):
-        return self.spark.dataset.select(col("Hotel_Name").alias("Hotel_Name")).distinct().collect()
-
+        return [name for name, _, _ in self.searchHotels("", limit=None)]
+
+    # Ricerca per prefisso (senza distinzione tra maiuscole e minuscole) per i suggerimenti durante la digitazione:
+    # restituisce le tuple (Hotel_Name, Country_Hotel, City_Hotel)
+    def searchHotels(self, prefix, country=None, city=None, limit=20):
+        self.getCatalog()
+        prefix = prefix.lower()
+        risultati = []
+        for i in range(bisect_left(self.indiceNomi, (prefix,)), len(self.indiceNomi)):
+            nome = self.indiceNomi[i]
+            if not nome[0].startswith(prefix) or (limit is not None and len(risultati) >= limit):
+                break
+            if (country is None or nome[2] == country) and (city is None or nome[3] == city):
+                risultati.append(nome[1:])
+        return risultati
+
+    # Il dizionario dei tag contiene già tutti i tag distinti: nessun job Spark
     def getTags(self):
-        tag = self.spark.dataset.select(explode(col("Tags")).alias("Tag"))
-        listoftags = tag.rdd.flatMap(lambda row: row).distinct().collect()
-        return listoftags
+        return list(self.spark.dictionaries.valori["Tags"])
 
     def getHotelsByCountry(self, country_name):
-        return self.spark.dataset.filter(col("Country_Hotel").like(country_name)).select(
-            col("Hotel_Name")).distinct().collect()
+        cities = self.getCatalog().get(country_name, {})
+        return sorted(hotel for hotels in cities.values() for hotel in hotels)
 
     def getHotelsByCity(self, cityname):
-        return self.spark.dataset.filter(col("City_Hotel").like(cityname)).select(
-            col("Hotel_Name")).distinct().collect()
+        return sorted(hotel for cities in self.getCatalog().values() for hotel in cities.get(cityname, []))
 
     # Dataset contenente i dati raggruppati per citta
+    @risultatoInCache
     def countryInformation(self):
-        df = self.spark.dataset
+        if self.approssimato:
+            return self.countryInformationApprossimata()
+        df = self.getAggregatiHotelMese()
 
         all_info = df.groupby("City_Hotel").agg(
-            count("*").alias("Total_Reviews"),
+            sum("Total_Reviews").alias("Total_Reviews"),
             countDistinct("Hotel_Name").alias("Number_Hotel"),
-            avg("Average_Score").alias("Average_Score"),
-            sum(when((col("Negative_Review").like("No Negative")) | (col("Negative_Review").like("Nothing")),
-                     0).otherwise(1)).alias("TotalN"),
-            sum(when((col("Positive_Review").like("No Positive")) | (col("Positive_Review").like("Nothing")),
-                     0).otherwise(1)).alias("TotalP"),
+            (sum("Sum_Average_Score") / sum("Count_Average_Score")).alias("Average_Score"),
+            sum("TotalN").alias("TotalN"),
+            sum("TotalP").alias("TotalP"),
         )
         return all_info
 
-    def wordsFrequency(self):
-        df = self.spark.dataset
+    # Come countryInformation, con Number_Hotel stimato dagli HyperLogLog per città al posto di countDistinct
+    def countryInformationApprossimata(self):
+        df = self.getAggregatiHotelMese().groupby("City_Hotel").agg(
+            sum("Total_Reviews").alias("Total_Reviews"),
+            (sum("Sum_Average_Score") / sum("Count_Average_Score")).alias("Average_Score"),
+            sum("TotalN").alias("TotalN"),
+            sum("TotalP").alias("TotalP"),
+        ).toPandas()
+        stime = {city: hll.result() for city, hll in self.getSketches().hotelPerCitta.items()}
+        df["Number_Hotel"] = df["City_Hotel"].map(lambda city: stime.get(city, (0, 0))[0])
+        df["Number_Hotel_Error"] = df["City_Hotel"].map(lambda city: stime.get(city, (0, 0))[1])
+        colonne = ["City_Hotel", "Total_Reviews", "Number_Hotel", "Average_Score", "TotalN", "TotalP",
+                   "Number_Hotel_Error"]
+        return self.spark.spark.createDataFrame(df[colonne])
 
-        # Unisci le parole delle recensioni in una singola colonna e convertile in minuscolo
-        words = df.select(
-            explode(
-                split(
-                    lower(concat(col("Negative_Review"), lit(" "), col("Positive_Review"))), "\s+")).alias("word"))
+    def wordsFrequency(self):
+        df = self.getIndiceParole()
 
         # Conta il numero di volte che ogni parola appare
-        return words.groupby("word").agg(
-            count("*").alias("Frequency")
+        return df.groupby("word").agg(
+            sum("Frequency").alias("Frequency")
         )
 
     def maxMinFrequency(self):
         df = self.wordsFrequency()
-        max_word = df.orderBy(col("Frequency").desc()).first()
-        min_word = df.orderBy(col("Frequency").asc()).first()
-        return max_word, min_word
+        # Un solo passaggio: massimo e minimo della coppia (Frequency, word) al posto di due ordinamenti completi
+        res = df.agg(
+            max(struct("Frequency", "word")).alias("Max"),
+            min(struct("Frequency", "word")).alias("Min")
+        ).first()
+        return res["Max"], res["Min"]
+
+    # Le N parole più frequenti senza stopwords e punteggiatura: filtro e ordinamento restano in Spark
+    @risultatoInCache
+    def topWordsFrequency(self, n=WORDCLOUD_SIZE):
+        if self.approssimato:
+            # Frequency è un limite inferiore, Frequency + Frequency_Error uno superiore
+            return self.getSketches().parole.top(n, "word", "Frequency")
+        # Stessa lista di stopwords del motore pandas e dell'indice di ricerca
+        stop_words = sorted(get_stop_words())
+        words = self.getIndiceParole().select(
+            regexp_replace(col("word"), r"^\p{Punct}+|\p{Punct}+$", "").alias("word"), "Frequency")
+        words = words.filter(col("word").rlike(r"\p{L}") & ~col("word").isin(stop_words))
+        return words.groupBy("word").agg(sum("Frequency").alias("Frequency")) \
+            .orderBy(col("Frequency").desc(), "word").limit(n).toPandas()
+
+    @risultatoInCache
+    def topTagsFrequency(self, n=WORDCLOUD_SIZE):
+        if self.approssimato:
+            tags = self.getSketches().tag.top(n + 1)
+            return tags[tags["word"] != ""].head(n).reset_index(drop=True)
+        return self.mostAndLeastTagUsed().filter(col("word") != "").limit(n).toPandas()
 
     # restituisce un dataframe contenente latitudine e longitutide
+    @risultatoInCache
     def getlatlong(self):
-        return self.spark.dataset.groupBy("Hotel_Name").agg({"lng": "first", "lat": "first"}).toPandas()
+        df = self.spark.hot.groupBy("Hotel_Name").agg(first("lng").alias("first(lng)"),
+                                                      first("lat").alias("first(lat)"))
+        return perMappa(self.spark.dictionaries.decode(df), lat="first(lat)", lng="first(lng)")
 
-    def getNumOfHotel(self):
-        return self.spark.dataset.select(col("Hotel_Name")).distinct().count()
+    def getTotalReviews(self):
+        return self.getAggregatiHotelMese().agg(sum("Total_Reviews")).first()[0]
 
-    def getCountryHotel(self):
-        return self.spark.dataset.select(col("Country_Hotel")).distinct().collect()
+    def getNumOfHotel(self):
+        self.getCatalog()
+        return len({nome[1] for nome in self.indiceNomi})
 
+    @risultatoInCache
     def getReviewerNationality(self):
-        df = self.spark.dataset
-        return df.select(col("Reviewer_Nationality")).distinct()
+        df = self.spark.hot.select(col("Reviewer_Nationality")).distinct()
+        return self.spark.dictionaries.decode(df)
 
+    @risultatoInCache
     def mostLeastUsedWordsByCity(self):
-        # frequencyword = self.wordsFrequency()
-        df = self.spark.dataset
-
-        fdf = df.select(col("City_Hotel"), explode(
-            split(lower(concat(col("Negative_Review"), lit(" "), col("Positive_Review"))), "\s+")).alias("Words"))
+        df = self.getIndiceParole()
 
-        word_frequency = fdf.groupBy("City_Hotel", "Words").agg(
-            count("*").alias("Frequency")
+        word_frequency = df.groupBy("City_Hotel", col("word").alias("Words")).agg(
+            sum("Frequency").alias("Frequency")
         )
 
-        maxword = word_frequency.groupBy("City_Hotel").agg(
-            max("Frequency").alias("Frequency")
-        )
-        minword = word_frequency.groupBy("City_Hotel").agg(
-            min("Frequency").alias("Frequency")
+        # Parola più e meno usata per città in un'unica aggregazione, senza join con le frequenze
+        extremes = word_frequency.groupBy("City_Hotel").agg(
+            max(struct("Frequency", "Words")).alias("Max"),
+            min(struct("Frequency", "Words")).alias("Min")
         )
 
-        maxword = maxword.join(word_frequency, ["City_Hotel", "Frequency"], how="inner")
-        minword = minword.join(word_frequency, ["City_Hotel", "Frequency"], how="inner").groupBy("City_Hotel").agg(
-            first("Words").alias("Words"),
-            first("Frequency").alias("Frequency")
-        )
+        maxword = extremes.select("City_Hotel", col("Max.Frequency").alias("Frequency"),
+                                  col("Max.Words").alias("Words"))
+        minword = extremes.select("City_Hotel", col("Min.Words").alias("Words"),
+                                  col("Min.Frequency").alias("Frequency"))
 
         return maxword, minword
 
@@ -169,89 +686,168 @@ class QueryManager:
         fdf = df.groupBy("Hotel_Name").agg(avg("Avarage_Score").alias("Avarage_Score"))
         return fdf
 
+    @risultatoInCache
     def hotelStatistics(self):
-        df = self.spark.dataset
+        df = self.getAggregatiHotelMese()
 
         res = df.groupBy("Hotel_Name").agg(
-            count("*").alias("Total_Reviews"),
-            sum(when(col("Positive_Review") != "No Positive", 1).otherwise(0)).alias("Total_Positive_Reviews"),
-            sum(when(col("Negative_Review") != "No Negative", 1).otherwise(0)).alias("Total_Negative_Reviews"),
-            max("Reviewer_Score").alias("Max_Reviewer_Score"),
-            min("Reviewer_Score").alias("Min_Reviewer_Score"),
-            avg("Reviewer_Score").alias("Avg_Reviewer_Score"),
-            first("lat").alias("Latitude"),
-            first("lng").alias("Longitude"),
-            avg("Additional_Number_of_Scoring").alias("Avg_Additional_Number_of_Scoring")
+            sum("Total_Reviews").alias("Total_Reviews"),
+            sum("Total_Positive_Reviews").alias("Total_Positive_Reviews"),
+            sum("Total_Negative_Reviews").alias("Total_Negative_Reviews"),
+            max("Max_Reviewer_Score").alias("Max_Reviewer_Score"),
+            min("Min_Reviewer_Score").alias("Min_Reviewer_Score"),
+            (sum("Sum_Reviewer_Score") / sum("Count_Reviewer_Score")).alias("Avg_Reviewer_Score"),
+            first("Latitude").alias("Latitude"),
+            first("Longitude").alias("Longitude"),
+            (sum("Sum_Additional_Number_of_Scoring") / sum("Count_Additional_Number_of_Scoring"))
+            .alias("Avg_Additional_Number_of_Scoring")
         )
         return res
 
+    # Profilo di ogni hotel (statistiche, coordinate e ultime recensioni) materializzato una volta sola in pandas,
+    # indicizzato per Hotel_Name: la selezione di un hotel nelle pagine diventa una ricerca nel dizionario
+    def getHotelProfiles(self):
+        with self.lock:
+            if self.profili is None:
+                df = self.spark.hot.filter(col("days_since_review").isNotNull())
+                # L'ultima recensione è quella con days_since_review minimo (a parità, Review_Id minimo):
+                # un'unica aggregazione sul dataset caldo, poi i testi delle sole recensioni scelte
+                ultime = df.groupBy("Hotel_Name").agg(min(struct("days_since_review", REVIEW_ID)).alias("Last"))
+                ultime = ultime.select("Hotel_Name", col(f"Last.{REVIEW_ID}").alias(REVIEW_ID),
+                                       col("Last.days_since_review").alias("DSR"))
+                ultime = self.spark.fetchText(self.spark.dictionaries.decode(ultime),
+                                              "Positive_Review", "Negative_Review")
+                ultime = ultime.select("Hotel_Name", col("Positive_Review").alias("Positive"),
+                                       col("Negative_Review").alias("Negative"), "DSR")
+                profili = toPandasLimitato(self.hotelStatistics().join(ultime, "Hotel_Name", "left"))
+                self.profili = profili.set_index("Hotel_Name", drop=False).rename_axis(None)
+        return self.profili
+
+    # Indice spaziale di hotel e monumenti costruito dai profili degli hotel, senza altri job Spark
+    def getSpatialIndex(self):
+        with self.lock:
+            if self.indiceSpaziale is None:
+                hotels = self.getHotelProfiles()[["Hotel_Name", "Latitude", "Longitude"]].copy()
+                self.getCatalog()
+                citta = {nome[1]: nome[3] for nome in self.indiceNomi}
+                hotels["City_Hotel"] = hotels["Hotel_Name"].map(citta)
+                self.indiceSpaziale = HotelSpatialIndex(hotels, loadMonuments())
+        return self.indiceSpaziale
+
     def getH1H2statistic(self, hotelname1, hotelname2):
-        df = self.hotelStatistics()
+        df = self.getHotelProfiles()
 
-        h1_stats = df.filter(col("Hotel_Name") == hotelname1).first().asDict()
-        h2_stats = df.filter(col("Hotel_Name") == hotelname2).first().asDict()
+        h1_stats = df.loc[[hotelname1]].to_dict("records")[0]
+        h2_stats = df.loc[[hotelname2]].to_dict("records")[0]
 
         return h1_stats, h2_stats
 
+    @risultatoInCache
     def longestShortestReviews(self):
-        df = self.spark.dataset
+        df = self.spark.hot
 
         # Seleziona le recensioni positive con Review_Total_Positive_Word_Counts massimo
         max_positive_count = df.selectExpr("MAX(Review_Total_Positive_Word_Counts) as Max_Positive_Count") \
             .collect()[0]["Max_Positive_Count"]
         reviews_positive = df.filter((col("Review_Total_Positive_Word_Counts") == max_positive_count))\
+            .select(REVIEW_ID, "Review_Total_Positive_Word_Counts")
+        reviews_positive = self.spark.fetchText(reviews_positive, "Positive_Review") \
             .select("Positive_Review", "Review_Total_Positive_Word_Counts")
 
         # Seleziona la recensione negativa con Review_Total_Negative_Word_Counts massimo
         max_negative_count = df.selectExpr("MAX(Review_Total_Negative_Word_Counts) as Max_Negative_Count") \
             .collect()[0]["Max_Negative_Count"]
         negative_review = df.filter(col("Review_Total_Negative_Word_Counts") == max_negative_count) \
+            .select(REVIEW_ID, "Review_Total_Negative_Word_Counts")
+        negative_review = self.spark.fetchText(negative_review, "Negative_Review") \
             .select("Negative_Review", "Review_Total_Negative_Word_Counts")
 
         return reviews_positive, negative_review
 
+    @risultatoInCache
     def mostAndLeastTagUsed(self):
-        df = self.spark.dataset
-
-        df_tags = df.select(explode("Tags").alias("word"))
-
-        # Conta la frequenza di ciascun tag
-        frequenza_tag = df_tags.groupBy("word").count()
+        # Le occorrenze di ciascun tag sono tenute nel dizionario dei tag: nessuna explode sul dataset
+        frequenza_tag = self.spark.spark.createDataFrame(self.spark.dictionaries.tagFrequencies(),
+                                                         "word string, count long")
 
         # Ordina il DataFrame per la frequenza in ordine decrescente
-        frequenza_tag = frequenza_tag.orderBy("count", ascending=False)
+        frequenza_tag = frequenza_tag.orderBy(col("count").desc(), "word")
 
         return frequenza_tag
 
-    def getWhenLastReviewWPOfHotel(self):
-        df = self.spark.dataset
-
-        # Trova il minimo days_since_review per ogni hotel
-        fdf = df.groupBy("Hotel_Name").agg(min(col("days_since_review")).alias("min_days_since_review"))
-        fdf = fdf.withColumnRenamed("Hotel_Name", "Name")
-
-        # Unisci il DataFrame originale con se stesso usando Hotel_Name e min_days_since_review
-        joined_df = df.join(fdf, (df["Hotel_Name"] == fdf["Name"]) & (
-                df["days_since_review"] == fdf["min_days_since_review"]), "inner")
-
-        # Seleziona le colonne desiderate
-        recensioni = joined_df.select("Hotel_Name", "days_since_review", "Positive_Review", "Negative_Review").orderBy(
-            "days_since_review")
+    # Statistiche delle recensioni che hanno tutti i tag indicati (ad esempio "Leisure trip" e "Couple"),
+    # eventualmente in una città, nazione o hotel e raggruppate per le colonne in "by". Il filtro sui tag
+    # lavora su maschera di bit e codici interi del dataset caldo, senza toccare le stringhe
+    @risultatoInCache
+    def tagStatistics(self, tags, city=None, country=None, hotel=None, by=()):
+        dictionaries = self.spark.dictionaries
+        df = self.spark.hot.filter(dictionaries.hasTags(tags))
+        for colonna, valore in (("City_Hotel", city), ("Country_Hotel", country), ("Hotel_Name", hotel)):
+            if valore is not None:
+                df = df.filter(col(colonna) == lit(dictionaries.codeOf(colonna, valore)))
+        statistiche = df.groupBy(*by).agg(
+            count("*").alias("Total_Reviews"),
+            avg("Reviewer_Score").alias("Avg_Reviewer_Score"),
+            min("Reviewer_Score").alias("Min_Reviewer_Score"),
+            max("Reviewer_Score").alias("Max_Reviewer_Score"),
+            avg("Average_Score").alias("Avg_Average_Score")
+        )
+        statistiche = dictionaries.decode(statistiche)
+        return statistiche.orderBy(*by) if by else statistiche
 
-        recensioni = recensioni.groupBy("Hotel_Name").agg(
-            {"days_since_review": "first", "Positive_Review": "first", "Negative_Review": "first"}).toPandas()
+    # Ricerca full-text nelle recensioni, ordinata per pertinenza (BM25): una tabella pandas con
+    # Review_Id, hotel, città, data, punteggio e testi delle recensioni trovate
+    def searchReviews(self, text, hotel=None, city=None, date_from=None, date_to=None, limit=SEARCH_LIMIT):
+        return self.getSearchIndex().search(text, hotel=hotel, city=city, date_from=date_from, date_to=date_to,
+                                            limit=limit)
 
-        return recensioni
+    # Ultima recensione di ogni hotel, con i nomi di colonna di sempre. Viene dai profili degli hotel: nessun
+    # self-join sull'intero snapshot, e lo stesso codice vale per il motore pandas
+    def getWhenLastReviewWPOfHotel(self):
+        df = self.getHotelProfiles()[["Hotel_Name", "DSR", "Positive", "Negative"]].dropna(subset=["DSR"])
+        return df.rename(columns={"DSR": "first(days_since_review)", "Positive": "first(Positive_Review)",
+                                  "Negative": "first(Negative_Review)"}).reset_index(drop=True)
 
     def getLastPositiveNegativeReviews(self, hotel_name, hotel_name2):
-        df = self.getWhenLastReviewWPOfHotel()
-        df.rename(columns={'first(days_since_review)': 'DSR'}, inplace=True)
-        df.rename(columns={'first(Positive_Review)': 'Positive'}, inplace=True)
-        df.rename(columns={'first(Negative_Review)': 'Negative'}, inplace=True)
-        return df[df['Hotel_Name'] == hotel_name], df[df['Hotel_Name'] == hotel_name2]
-
-    def getDatasetForClassification(self):
-        df = self.spark.dataset
+        df = self.getHotelProfiles()[["Hotel_Name", "Positive", "Negative", "DSR"]]
+        return df.loc[[hotel_name]].reset_index(drop=True), df.loc[[hotel_name2]].reset_index(drop=True)
+
+    # Tutte le recensioni con il sentiment predetto dal modello, calcolato in batch e salvato su disco.
+    # Classificare l'intero corpus è un job lungo: lo esegue 'python Sentiment.py score' (build=True),
+    # le pagine leggono soltanto il risultato salvato. Il lock evita due scritture insieme sulla stessa cartella
+    def getScoredDataset(self, build=False):
+        with self.lock:
+            path = self.spark.snapshotPath(SCORED_DIR)
+            if not self.isDerivedValid(path):
+                if not build:
+                    raise FileNotFoundError("Recensioni classificate non disponibili: eseguire 'python Sentiment.py "
+                                            "score'")
+                scoreDataset(self.spark.fullDataset(), loadSparkModel(self.spark.fingerprint)) \
+                    .write.mode("overwrite").partitionBy(*SNAPSHOT_PARTITIONS).parquet(path)
+                write_fingerprint(path, self.spark.fingerprint)
+            return self.spark.spark.read.parquet(path)
+
+    @risultatoInCache
+    def predictedSentimentBy(self, *keys):
+        df = self.getScoredDataset()
+        return df.groupBy(*keys).agg(
+            (sum(when(col("Positive_Sentiment") == 1, 1).otherwise(0))
+             + sum(when(col("Negative_Sentiment") == 1, 1).otherwise(0))).alias("Predicted_Positive"),
+            (sum(when(col("Positive_Sentiment") == 0, 1).otherwise(0))
+             + sum(when(col("Negative_Sentiment") == 0, 1).otherwise(0))).alias("Predicted_Negative"),
+            avg("Positive_Confidence").alias("Avg_Positive_Confidence"),
+            avg("Negative_Confidence").alias("Avg_Negative_Confidence")
+        ).orderBy(*keys)
+
+    def predictedSentimentByCity(self):
+        return self.predictedSentimentBy("City_Hotel")
+
+    def predictedSentimentByHotel(self):
+        return self.predictedSentimentBy("City_Hotel", "Hotel_Name")
+
+    # Recensioni etichettate (1 positiva, 0 negativa) come DataFrame Spark, per l'addestramento distribuito
+    def getClassificationDataFrame(self):
+        df = self.spark.coldTable("Positive_Review", "Negative_Review")
         review_p = df.select(col("Positive_Review").alias("Review"))
         new_df_p = review_p.withColumn("Sentiment", lit(1))
         new_df_p = new_df_p.filter(~col("Review").like("No Positive"))
@@ -260,12 +856,23 @@ class QueryManager:
         new_df_n = review_n.withColumn("Sentiment", lit(0))
         new_df_n = new_df_n.filter(~col("Review").like("No Negative"))
 
-        dataset = new_df_p.union(new_df_n)
+        return new_df_p.union(new_df_n)
+
+    def getDatasetForClassification(self):
+        dataset = self.getClassificationDataFrame()
         print(dataset.count())
-        return dataset.toPandas()
+        # Il corpus arriva a blocchi e si interrompe se supera il budget, invece di esaurire la memoria del driver
+        return pd.concat(iterChunks(dataset, max_bytes=TRANSFER_TRAINING_MAX_BYTES), ignore_index=True)
 
+    @risultatoInCache
     def getNumberOfDifferentReviewerNationality(self):
-        df = self.spark.dataset
+        if self.approssimato:
+            righe = [(city, *hll.result()) for city, hll in self.getSketches().nazionalitaPerCitta.items()]
+            return self.spark.spark.createDataFrame(
+                sorted(righe, key=lambda riga: riga[0]),
+                "City_Hotel string, Different_Nationality long, Different_Nationality_Error long")
+        # Ogni riga di questo livello è già una coppia distinta (città, nazionalità)
+        df = self.getAggregati().filter(col("Livello") == LIVELLO_NAZIONALITA)
 
         numNationality = df.groupBy("City_Hotel") \
             .agg(countDistinct("Reviewer_Nationality").alias("Different_Nationality")) \
@@ -274,62 +881,66 @@ class QueryManager:
         return numNationality
 
     #Media delle valutazioni degli hotel per anno o mese
+    @risultatoInCache
     def getValutationByYearAMonth(self):
-        df = self.spark.dataset
+        df = self.getAggregatiHotelMese()
+        average_score = (sum("Sum_Average_Score") / sum("Count_Average_Score")).alias("avg(Average_Score)")
         # Calcolare la media delle valutazioni degli hotel per anno
-        average_score_per_year = df.groupBy("Review_Year").avg("Average_Score").orderBy("Review_Year")
+        average_score_per_year = df.groupBy("Review_Year").agg(average_score).orderBy("Review_Year")
 
         # Calcolare la media delle valutazioni degli hotel per mese
-        average_score_per_month = df.groupBy("Review_Year", "Review_Month").avg("Average_Score").orderBy("Review_Year",
-                                                                                                         "Review_Month")
-        return average_score_per_year.toPandas(),average_score_per_month.toPandas()
+        average_score_per_month = df.groupBy("Review_Year", "Review_Month").agg(average_score).orderBy("Review_Year",
+                                                                                                       "Review_Month")
+        return (toPandasLimitato(average_score_per_year, CHART_MAX_POINTS),
+                toPandasLimitato(average_score_per_month, CHART_MAX_POINTS))
 
+    @risultatoInCache
     def getTotalReviewByYearAMonth(self):
-        df = self.spark.dataset
+        df = self.getAggregatiHotelMese()
+        total = sum("Total_Reviews").alias("count")
         # Contare il numero totale di recensioni per anno
-        reviews_count_per_year = df.groupBy("Review_Year").count().orderBy("Review_Year")
+        reviews_count_per_year = df.groupBy("Review_Year").agg(total).orderBy("Review_Year")
 
         # Contare il numero totale di recensioni per mese
-        reviews_count_per_month = df.groupBy("Review_Year", "Review_Month").count().orderBy("Review_Year",
-                                                                                            "Review_Month")
+        reviews_count_per_month = df.groupBy("Review_Year", "Review_Month").agg(total).orderBy("Review_Year",
+                                                                                               "Review_Month")
         return reviews_count_per_year,reviews_count_per_month
 
+    @risultatoInCache
     def avarageNegativeAndPositveWordsForMonthAndYear(self):
-        df = self.spark.dataset
+        df = self.getAggregatiHotelMese()
         average_negative_words = (df.groupBy("Review_Year", "Review_Month").agg(
-            avg("Review_Total_Negative_Word_Counts").alias("Avarage"))
+            (sum("Sum_Negative_Words") / sum("Count_Negative_Words")).alias("Avarage"))
                                   .orderBy("Review_Year", "Review_Month"))
         average_positive_words = (df.groupBy("Review_Year", "Review_Month").agg(
-            avg("Review_Total_Positive_Word_Counts").alias("Avarage"))
+            (sum("Sum_Positive_Words") / sum("Count_Positive_Words")).alias("Avarage"))
                                   .orderBy("Review_Year", "Review_Month"))
         return average_positive_words, average_negative_words
 
+    @risultatoInCache
     def getMostAndLeastUsedWordPerYear(self):
-        df = self.spark.dataset
-        df = df.withColumn("Full_Review", concat(col("Negative_Review"), lit(" "), col("Positive_Review")))
-
-        # Estrarre le parole dalle recensioni
-        fdf = df.select("Review_Year", explode(split(lower("Full_Review"), "\s+")).alias("Words"))
+        df = self.getIndiceParole()
 
         # Contare la frequenza delle parole per ogni anno
-        word_counts_per_year = fdf.groupBy("Review_Year", "Words").count()
+        word_counts_per_year = df.groupBy("Review_Year", col("word").alias("Words")).agg(
+            sum("Frequency").alias("count"))
 
         # Trovare la parola più utilizzata e meno utilizzata per ogni anno
-        word_most_used_per_year = word_counts_per_year.orderBy("Review_Year",
-                                                               word_counts_per_year["count"].desc()).groupby(
-            "Review_Year").agg({'Words': 'first'})
-        word_least_used_per_year = word_counts_per_year.orderBy("Review_Year", word_counts_per_year["count"]).groupby(
-            "Review_Year").agg({'Words': 'first'})
+        extremes = word_counts_per_year.groupBy("Review_Year").agg(
+            max(struct("count", "Words")).alias("Max"),
+            min(struct("count", "Words")).alias("Min")
+        ).orderBy("Review_Year")
+        word_most_used_per_year = extremes.select("Review_Year", col("Max.Words").alias("first(Words)"))
+        word_least_used_per_year = extremes.select("Review_Year", col("Min.Words").alias("first(Words)"))
 
         return word_most_used_per_year,word_least_used_per_year
 
+    @risultatoInCache
     def getCorrelationBetweenReviewAndSeason(self):
-        df = self.spark.dataset
-        df = df.withColumn("Season",
-                           when((df["Review_Month"] >= 3) & (df["Review_Month"] <= 5), "Spring")
-                           .when((df["Review_Month"] >= 6) & (df["Review_Month"] <= 8), "Summer")
-                           .when((df["Review_Month"] >= 9) & (df["Review_Month"] <= 11), "Autumn")
-                           .otherwise("Winter"))
+        if self.approssimato:
+            return self.getCorrelationBetweenReviewAndSeasonApprossimata()
+        df = self.spark.hot
+        df = df.withColumn("Season", stagione(df["Review_Month"]))
         # Raggruppare le recensioni per stagione e calcolare il numero di recensioni e la valutazione media
         result = df.groupBy("Season").agg(
             count("*").alias("Total"),
@@ -337,4 +948,117 @@ class QueryManager:
         ).orderBy("Season")
         return result
 
-    
\ No newline at end of file
+    # Campione stratificato per mese: ogni mese ha almeno SAMPLE_MIN_ROWS righe attese, le stime per stagione
+    # combinano gli strati pesandoli con la loro dimensione; Total_Error e AScore_Error sono intervalli al 95%
+    def getCorrelationBetweenReviewAndSeasonApprossimata(self, fraction=SAMPLE_FRACTION, min_rows=SAMPLE_MIN_ROWS):
+        mesi = self.getAggregatiHotelMese().filter(col("Review_Month").isNotNull()) \
+            .groupBy("Review_Month").agg(sum("Total_Reviews").alias("N")).collect()
+        frazioni = {row["Review_Month"]: float(builtins.min(1.0, builtins.max(fraction, min_rows / row["N"])))
+                    for row in mesi}
+        campione = self.spark.hot.sampleBy("Review_Month", frazioni, seed=42)
+        strati = campione.groupBy("Review_Month").agg(
+            count("*").alias("n"),
+            avg("Average_Score").alias("mean"),
+            variance("Average_Score").alias("var")
+        ).toPandas()
+        strati["f"] = strati["Review_Month"].map(frazioni)
+        strati["N"] = strati["n"] / strati["f"]
+        strati["Season"] = strati["Review_Month"].map(stagioneMese)
+        strati["var"] = strati["var"].fillna(0)
+
+        righe = []
+        for season, gruppo in strati.groupby("Season"):
+            totale = gruppo["N"].sum()
+            pesi = gruppo["N"] / totale
+            righe.append((
+                season,
+                int(round(totale)),
+                float((pesi * gruppo["mean"]).sum()),
+                float(SKETCH_Z * np.sqrt((gruppo["n"] * (1 - gruppo["f"]) / gruppo["f"] ** 2).sum())),
+                float(SKETCH_Z * np.sqrt((pesi ** 2 * gruppo["var"] / gruppo["n"]).sum())),
+            ))
+        return self.spark.spark.createDataFrame(
+            sorted(righe), "Season string, Total long, AScore double, Total_Error double, AScore_Error double")
+
+
+# Registro dei SparkBuilder del processo: Backend viene importato una volta sola, quindi tutte le pagine
+# e tutte le sessioni Streamlit ricevono la stessa istanza invece di ricaricare il dataset
+_builders = {}
+_builders_lock = threading.Lock()
+
+
+def getSparkBuilder(appname=APP_NAME, path=PATH_DS, snapshot=PATH_SNAPSHOT, warm_up=True, engine=QUERY_ENGINE,
+                    ingestion=INGESTION_ENABLED):
+    key = (engine, path, snapshot)
+    with _builders_lock:
+        builder = _builders.get(key)
+        if builder is None or builder.closed:
+            if engine == "pandas":
+                # Import locale: LocalEngine estende il QueryManager di questo modulo
+                from LocalEngine import LocalBuilder
+                builder = LocalBuilder(path=path, snapshot=snapshot)
+            else:
+                builder = SparkBuilder(appname, path=path, snapshot=snapshot)
+            if warm_up:
+                builder.warmUp()
+            # Il motore pandas legge solo lo snapshot: l'ingestion resta una funzione del motore Spark
+            if ingestion and engine != "pandas":
+                builder.startIngestion()
+            _builders[key] = builder
+    # Il pool è una proprietà del thread: ogni sessione Streamlit lo imposta a ogni esecuzione della pagina
+    if engine != "pandas":
+        builder.spark.sparkContext.setLocalProperty("spark.scheduler.pool", SCHEDULER_POOL)
+    return builder
+
+
+# Esecutore condiviso dalle pagine per lanciare le proprie query in parallelo sulla stessa SparkContext
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def getQueryExecutor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=QUERY_THREADS, thread_name_prefix="query")
+    return _executor
+
+
+# Esegue fn in un thread dell'esecutore e restituisce il Future. Pool FAIR e pagina del profiler sono
+# proprietà del thread: vengono copiati da quello che invia la query, così i job concorrenti si dividono
+# gli executor nel pool della pagina e i tempi restano attribuiti alla sua esecuzione
+def submitQuery(builder, fn, *args, **kwargs):
+    sc = builder.spark.sparkContext if isinstance(builder, SparkBuilder) else None
+    pool = (sc.getLocalProperty("spark.scheduler.pool") or SCHEDULER_POOL) if sc is not None else None
+    profiler = getattr(builder, "profiler", None)
+    context = profiler.pageContext() if profiler is not None else None
+
+    def task():
+        if sc is not None:
+            sc.setLocalProperty("spark.scheduler.pool", pool)
+        if context is not None:
+            profiler.restorePageContext(context)
+        return fn(*args, **kwargs)
+
+    return getQueryExecutor().submit(task)
+
+
+@atexit.register
+def closeSparkBuilders():
+    with _builders_lock:
+        for builder in _builders.values():
+            builder.closeConnection()
+        _builders.clear()
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    # Prepara su disco snapshot e strutture derivate prima di aprire l'applicazione (le cache in memoria sono di
+    # questo processo: quelle del server le riscalda Server.py all'avvio).
+    # Con PROVA_INGESTION=1 il processo resta attivo e aggiunge allo snapshot i file della cartella di drop
+    builder = getSparkBuilder()
+    print(builder.healthCheck())
+    if builder.ingestion is not None:
+        builder.ingestion.awaitTermination()
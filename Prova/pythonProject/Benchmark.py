@@ -0,0 +1,309 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+from pyspark.sql.functions import col, udf
+from pyspark.sql.types import StringType
+
+from Backend import SparkBuilder, estraiCittaColumn
+from LocalEngine import LocalBuilder
+from Schema import SCHEMA_RECENSIONI, leggiRecensioni
+from Utility import estraiCitta
+
+BENCHMARK_SIZES = [100_000, 1_000_000, 10_000_000]
+CHUNK_SIZE = 100_000
+
+# Città del dataset originale con coordinate indicative; gli indirizzi seguono il formato di Hotel_Reviews.csv
+CITIES = [
+    ("Amsterdam", "Netherlands", 52.37, 4.89, ["1017", "1092", "1071"], ["Centrum", "Oost", "Zuid"]),
+    ("Barcelona", "Spain", 41.39, 2.17, ["08013", "08007", "08036"], ["Eixample", "Gracia", "Sants"]),
+    ("Milan", "Italy", 45.46, 9.19, ["20124", "20121", "20159"], ["Centrale", "Brera", "Isola"]),
+    ("Paris", "France", 48.86, 2.35, ["75008", "75001", "75015"], ["Elys", "Louvre", "Vaugirard"]),
+    ("Vienna", "Austria", 48.21, 16.37, ["1010", "1030", "1070"], ["Innere", "Landstra", "Neubau"]),
+    ("London", "United Kingdom", 51.51, -0.13, ["W1J", "SW1A", "NW1"], ["Mayfair", "Westminster", "Camden"]),
+]
+STREETS = ["Stratton Street", "Carrer de Sants", "Via Vittor Pisani", "Rue de Rivoli", "Ringstrasse",
+           "Gravesandestraat", "Kensington Road", "Avenue Montaigne", "Corso Como", "Mariahilfer Strasse"]
+NATIONALITIES = ["United Kingdom", "United States of America", "Australia", "Ireland", "Germany", "France",
+                 "Italy", "Netherlands", "Spain", "Switzerland", "Canada", "Israel", "India", "China"]
+VOCABULARY = ("the room was very good and clean staff friendly breakfast location great small bed bathroom "
+              "hotel nice excellent comfortable helpful noisy expensive price view quiet shower wifi a of "
+              "to in it not but bar poor dirty lovely perfect stay everything nothing walk station close "
+              "spacious modern old air conditioning coffee tea parking reception service slow cold hot").split()
+PUNCTUATION = ["", "", "", "", ",", ".", "!"]
+TRIP_TAGS = ["Leisure trip", "Business trip"]
+GROUP_TAGS = ["Couple", "Solo traveler", "Family with young children", "Group", "Travelers with friends"]
+ROOM_TAGS = ["Double Room", "Standard Double Room", "Superior Double Room", "Deluxe King Room", "Twin Room"]
+LAST_REVIEW_DATE = date(2017, 8, 3)
+# Strutture condivise costruite alla prima richiesta e riusate dalle query: misurate a parte, nell'ordine
+# in cui dipendono l'una dall'altra
+SHARED_STRUCTURES = ["getAggregati", "getIndiceParole", "getCatalog", "getHotelProfiles"]
+
+
+# Un piccolo insieme di testi già pronti da cui campionare: generare ogni recensione sarebbe troppo lento a 10M righe
+def _textPool(rng, size, placeholder, placeholder_rate):
+    texts, counts = [], []
+    for _ in range(size):
+        if rng.random() < placeholder_rate:
+            texts.append(placeholder)
+            counts.append(0)
+            continue
+        n = int(rng.integers(1, 60))
+        words = [w + PUNCTUATION[rng.integers(len(PUNCTUATION))] for w in rng.choice(VOCABULARY, n)]
+        texts.append(" " + " ".join(words) + " ")
+        counts.append(n)
+    return np.array(texts, dtype=object), np.array(counts)
+
+
+def _tagPool(rng, size):
+    pool = []
+    for _ in range(size):
+        tags = [rng.choice(TRIP_TAGS), rng.choice(GROUP_TAGS), rng.choice(ROOM_TAGS),
+                f"Stayed {rng.integers(1, 15)} nights"]
+        if rng.random() < 0.6:
+            tags.append("Submitted from a mobile device")
+        pool.append("[" + ", ".join(f"' {t} '" for t in tags) + "]")
+    return np.array(pool, dtype=object)
+
+
+def _hotels(rng, n_hotels):
+    hotels = []
+    for i in range(n_hotels):
+        city, country, lat, lng, zips, districts = CITIES[rng.integers(len(CITIES))]
+        street = rng.choice(STREETS)
+        number = rng.integers(1, 200)
+        if country == "United Kingdom":
+            # Circa il 2% degli indirizzi inglesi ha il CAP 6BD, con la città sei parole prima di "Kingdom"
+            if rng.random() < 0.02:
+                address = f"{number} {street} London {rng.choice(zips)} 6BD {rng.choice(districts)} Westminster " \
+                          f"United Kingdom"
+            else:
+                address = f"{number} {street} {rng.choice(districts)} London {rng.choice(zips)} 8LT United Kingdom"
+        else:
+            address = f"{street} {number} {rng.choice(districts)} {rng.choice(zips)} {city} {country}"
+        missing = rng.random() < 0.02
+        hotels.append({
+            "Hotel_Address": address,
+            "Hotel_Name": f"Hotel {street.split()[-1]} {city} {i}",
+            "Additional_Number_of_Scoring": int(rng.integers(1, 2700)),
+            "Average_Score": round(float(rng.uniform(5.2, 9.8)), 1),
+            "Total_Number_of_Reviews": int(rng.integers(40, 16000)),
+            "lat": "NA" if missing else f"{lat + rng.normal(0, 0.02):.7f}",
+            "lng": "NA" if missing else f"{lng + rng.normal(0, 0.02):.7f}",
+        })
+    return pd.DataFrame(hotels)
+
+
+# Genera un CSV con la stessa struttura di Hotel_Reviews.csv, scritto a blocchi per non esaurire la memoria
+def generateDataset(path, rows, seed=42):
+    rng = np.random.default_rng(seed)
+    hotels = _hotels(rng, max(50, rows // 350))
+    weights = rng.zipf(1.5, len(hotels)).astype(float)
+    weights /= weights.sum()
+    negatives, negative_counts = _textPool(rng, 5000, "No Negative", 0.25)
+    positives, positive_counts = _textPool(rng, 5000, "No Positive", 0.07)
+    tags = _tagPool(rng, 2000)
+    span = (LAST_REVIEW_DATE - date(2015, 8, 4)).days
+    columns = [field.name for field in SCHEMA_RECENSIONI.fields]
+
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        for start in range(0, rows, CHUNK_SIZE):
+            n = min(CHUNK_SIZE, rows - start)
+            chunk = hotels.iloc[rng.choice(len(hotels), n, p=weights)].reset_index(drop=True)
+            days = rng.integers(0, span + 1, n)
+            dates = pd.to_datetime(LAST_REVIEW_DATE) - pd.to_timedelta(days, unit="D")
+            neg = rng.integers(len(negatives), size=n)
+            pos = rng.integers(len(positives), size=n)
+
+            chunk["Review_Date"] = (dates.month.astype(str) + "/" + dates.day.astype(str) + "/"
+                                    + dates.year.astype(str))
+            chunk["Reviewer_Nationality"] = " " + pd.Series(rng.choice(NATIONALITIES, n)) + " "
+            chunk["Negative_Review"] = negatives[neg]
+            chunk["Review_Total_Negative_Word_Counts"] = negative_counts[neg]
+            chunk["Positive_Review"] = positives[pos]
+            chunk["Review_Total_Positive_Word_Counts"] = positive_counts[pos]
+            chunk["Total_Number_of_Reviews_Reviewer_Has_Given"] = rng.geometric(0.2, n)
+            chunk["Reviewer_Score"] = np.round(rng.uniform(2.5, 10.0, n), 1)
+            chunk["Tags"] = tags[rng.integers(len(tags), size=n)]
+            chunk["days_since_review"] = pd.Series(days).astype(str) + " days"
+            chunk[columns].to_csv(f, header=start == 0, index=False)
+    return path
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+# Esegue tutto il piano senza portare risultati sul driver
+def noop(df):
+    df.write.format("noop").mode("overwrite").save()
+
+
+# Forza il calcolo del risultato di un metodo del QueryManager, come farebbero le pagine
+def materialize(result):
+    if isinstance(result, (tuple, list)):
+        for item in result:
+            materialize(item)
+    elif hasattr(result, "rdd") and hasattr(result, "write"):
+        noop(result)
+    return result
+
+
+def benchmarkLoad(csv_path, snapshot):
+    report = {}
+    report["cold_start"], builder = timed(lambda: SparkBuilder("benchmark", path=csv_path, snapshot=snapshot))
+    report["cache"], _ = timed(builder.hot.count)
+    builder.hot.unpersist()
+    report["warm_start"], builder = timed(lambda: SparkBuilder("benchmark", path=csv_path, snapshot=snapshot))
+    builder.hot.count()
+    # Avvio del motore pandas sullo stesso snapshot: solo colonne calde, i testi restano su disco
+    report["local_start"], _ = timed(lambda: LocalBuilder(path=csv_path, snapshot=snapshot).warmUp())
+
+    session = builder.spark
+    raw = leggiRecensioni(session, csv_path)
+    report["read"], _ = timed(lambda: noop(raw))
+    # Senza City_Hotel la proiezione contiene solo i cast: Spark elimina l'estrazione della città
+    report["cast"], _ = timed(lambda: noop(builder.castDataset(raw).drop("City_Hotel")))
+    cast = builder.castDataset(raw).select("Hotel_Address", "Country_Hotel")
+    report["city_native"], _ = timed(lambda: noop(cast.select(estraiCittaColumn())))
+
+    def estraiCittaSicura(indirizzo, country):
+        try:
+            return estraiCitta(indirizzo, country)
+        except (ValueError, IndexError, AttributeError):
+            return None
+
+    udf_estraiCitta = udf(estraiCittaSicura, StringType())
+    citta_udf = cast.select(udf_estraiCitta(col("Hotel_Address"), col("Country_Hotel")))
+    report["city_udf"], _ = timed(lambda: noop(citta_udf))
+    return builder, report
+
+
+# Costruzione delle strutture condivise, ognuna misurata da sola (le precedenti sono già pronte)
+def benchmarkShared(query):
+    structures = SHARED_STRUCTURES + (["getSketches"] if query.approssimato else [])
+    report = {}
+    for name in structures:
+        report[name], _ = timed(lambda: materialize(getattr(query, name)()))
+    return report
+
+
+def benchmarkQueries(builder):
+    query = builder.query
+    cache = query.getResultCache()
+    # Le strutture condivise si costruiscono prima: "cold" misura la query, non la loro costruzione
+    shared = benchmarkShared(query)
+    hotels = query.getHotelName()
+    h1, h2 = hotels[0], hotels[-1]
+    methods = [
+        ("countryInformation", ()), ("wordsFrequency", ()), ("maxMinFrequency", ()), ("topWordsFrequency", ()),
+        ("topTagsFrequency", ()), ("getlatlong", ()), ("getNumOfHotel", ()), ("getCountryHotel", ()),
+        ("getCityHotel", ()), ("getReviewerNationality", ()), ("mostLeastUsedWordsByCity", ()),
+        ("hotelStatistics", ()), ("getH1H2statistic", (h1, h2)),
+        ("getLastPositiveNegativeReviews", (h1, h2)), ("longestShortestReviews", ()),
+        ("mostAndLeastTagUsed", ()), ("getNumberOfDifferentReviewerNationality", ()),
+        ("getValutationByYearAMonth", ()), ("getTotalReviewByYearAMonth", ()),
+        ("avarageNegativeAndPositveWordsForMonthAndYear", ()), ("getMostAndLeastUsedWordPerYear", ()),
+        ("getCorrelationBetweenReviewAndSeason", ()),
+    ]
+    report = {}
+    for name, args in methods:
+        method = getattr(query, name)
+        # Cold e warm ricalcolano entrambe il risultato senza la ResultCache: la prima paga la prima esecuzione
+        # del piano, la seconda misura il caso a regime. "cached" è la lettura dalla cache già popolata
+        cache.bypass = True
+        try:
+            cold, _ = timed(lambda: materialize(method(*args)))
+            warm, _ = timed(lambda: materialize(method(*args)))
+        finally:
+            cache.bypass = False
+        materialize(method(*args))
+        cached, _ = timed(lambda: materialize(method(*args)))
+        report[name] = {"cold": cold, "warm": warm, "cached": cached}
+    return {"shared": shared, "methods": report}
+
+
+def runBenchmark(sizes, output, workdir, seed=42):
+    os.makedirs(workdir, exist_ok=True)
+    report = {"meta": {"timestamp": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+                       "machine": platform.machine(), "cores": os.cpu_count(), "seed": seed}, "runs": {}}
+    builder = None
+    for rows in sizes:
+        csv_path = os.path.join(workdir, f"reviews_{rows}.csv")
+        snapshot = os.path.join(workdir, f"snapshot_{rows}")
+        if not os.path.exists(csv_path):
+            print(f"Generazione di {rows} righe in {csv_path}")
+            generateDataset(csv_path, rows, seed)
+        # Ogni misura parte da uno snapshot assente, così cold_start comprende lettura e pulizia del CSV
+        shutil.rmtree(snapshot, ignore_errors=True)
+
+        builder, load = benchmarkLoad(csv_path, snapshot)
+        report["meta"]["spark"] = builder.spark.version
+        queries = benchmarkQueries(builder)
+        report["runs"][str(rows)] = {"load": load, "queries": queries}
+        builder.spark.catalog.clearCache()
+        print(json.dumps(report["runs"][str(rows)], indent=2))
+
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    if builder is not None:
+        builder.closeConnection()
+    return report
+
+
+# Confronta due report e segnala le misure peggiorate oltre la soglia (es. 1.2 = 20% più lente)
+def compareReports(baseline_path, candidate_path, threshold=1.2):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["runs"]
+    with open(candidate_path) as f:
+        candidate = json.load(f)["runs"]
+
+    regressions = []
+    for rows in sorted(set(baseline) & set(candidate), key=int):
+        measures = [(f"load.{k}", v, candidate[rows]["load"].get(k)) for k, v in baseline[rows]["load"].items()]
+        queries, new_queries = baseline[rows]["queries"], candidate[rows]["queries"]
+        for name, old in queries.get("shared", {}).items():
+            measures.append((f"shared.{name}", old, new_queries.get("shared", {}).get(name)))
+        for name, times in queries.get("methods", {}).items():
+            for phase in ("cold", "warm", "cached"):
+                new = new_queries.get("methods", {}).get(name, {}).get(phase)
+                if phase in times:
+                    measures.append((f"{name}.{phase}", times[phase], new))
+        for name, old, new in measures:
+            if new is None or old <= 0:
+                continue
+            ratio = new / old
+            flag = "REGRESSION" if ratio > threshold else ""
+            print(f"{rows:>10} {name:<60} {old:9.3f}s {new:9.3f}s {ratio:6.2f}x {flag}")
+            if ratio > threshold:
+                regressions.append((rows, name, ratio))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark di SparkBuilder e QueryManager su dati sintetici")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run")
+    run.add_argument("--rows", type=int, nargs="+", default=BENCHMARK_SIZES)
+    run.add_argument("--output", default="benchmark_report.json")
+    run.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "prova_benchmark"))
+    run.add_argument("--seed", type=int, default=42)
+    compare = commands.add_parser("compare")
+    compare.add_argument("baseline")
+    compare.add_argument("candidate")
+    compare.add_argument("--threshold", type=float, default=1.2)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        runBenchmark(args.rows, args.output, args.workdir, args.seed)
+    else:
+        raise SystemExit(1 if compareReports(args.baseline, args.candidate, args.threshold) else 0)
@@ -0,0 +1,160 @@
+import json
+import os
+
+from pyspark.sql.functions import (aggregate, array, array_contains, coalesce, col, collect_set, explode, lit,
+                                   map_from_arrays, transform, when)
+
+from Utility import REVIEW_ID, TAG_MASK_BITS
+
+DICTIONARY_FILE = "dictionaries.json"
+
+# Colonne di testo ripetitive sostituite da codici interi nel dataset caldo
+ENCODED_COLUMNS = ("Hotel_Name", "City_Hotel", "Country_Hotel", "Reviewer_Nationality")
+# Colonne del dataset caldo che restano come sono
+PLAIN_COLUMNS = ("Additional_Number_of_Scoring", "Review_Date", "Average_Score", "Review_Total_Negative_Word_Counts",
+                 "Total_Number_of_Reviews", "Review_Total_Positive_Word_Counts",
+                 "Total_Number_of_Reviews_Reviewer_Has_Given", "Reviewer_Score", "days_since_review", "lat", "lng",
+                 "Review_Year", "Review_Month", "Negative_Kind", "Positive_Kind")
+# Testi lunghi: restano soltanto nello snapshot e vengono letti quando servono
+COLD_COLUMNS = ("Hotel_Address", "Negative_Review", "Positive_Review")
+
+# Tipo di una recensione, salvato nello snapshot accanto al testo e usato dagli aggregati al posto del testo:
+# 0 segnaposto ("No Negative" / "No Positive"), 1 "Nothing", 2 testo vero, null se manca
+TEXT_PLACEHOLDER, TEXT_NOTHING, TEXT_PRESENT = 0, 1, 2
+
+
+def tipoTesto(colonna, segnaposto):
+    return when(col(colonna) == segnaposto, TEXT_PLACEHOLDER) \
+        .when(col(colonna) == "Nothing", TEXT_NOTHING) \
+        .when(col(colonna).isNotNull(), TEXT_PRESENT) \
+        .cast("tinyint")
+
+
+# Dizionari delle colonne codificate e dei tag: il codice di un valore è la sua posizione nella lista.
+# I valori nuovi dei batch vengono aggiunti in fondo, quindi i codici già assegnati non cambiano mai.
+# Per i tag si tengono anche le occorrenze e un bit (in Tags_Mask) per ciascuno dei più frequenti
+class DatasetDictionaries:
+    def __init__(self):
+        self.valori = {c: [] for c in (*ENCODED_COLUMNS, "Tags")}
+        self.codici = {c: {} for c in self.valori}
+        self.frequenzeTag = []
+        self.bitTag = {}
+
+    # Valori distinti di un dataset completo (con i nomi e i tag in chiaro) e occorrenze dei tag
+    @staticmethod
+    def distinctValues(dataset):
+        row = dataset.agg(*[collect_set(c).alias(c) for c in ENCODED_COLUMNS]).first()
+        valori = {c: row[c] for c in ENCODED_COLUMNS}
+        tags = dataset.select(explode("Tags").alias("Tag")).groupBy("Tag").count().collect()
+        frequenze = {r["Tag"]: r["count"] for r in tags if r["Tag"] is not None}
+        valori["Tags"] = list(frequenze)
+        return valori, frequenze
+
+    @staticmethod
+    def build(dataset):
+        return DatasetDictionaries().extend(dataset)
+
+    def extend(self, dataset):
+        valori, frequenze = DatasetDictionaries.distinctValues(dataset)
+        for c, nuovi in valori.items():
+            codici = self.codici[c]
+            for valore in sorted(v for v in nuovi if v is not None and v not in codici):
+                codici[valore] = len(self.valori[c])
+                self.valori[c].append(valore)
+
+        self.frequenzeTag.extend([0] * (len(self.valori["Tags"]) - len(self.frequenzeTag)))
+        for tag, n in frequenze.items():
+            self.frequenzeTag[self.codici["Tags"][tag]] += n
+        # I bit ancora liberi vanno ai tag più frequenti che non ne hanno uno: quelli assegnati restano
+        liberi = TAG_MASK_BITS - len(self.bitTag)
+        candidati = sorted((c for c in range(len(self.frequenzeTag)) if c not in self.bitTag),
+                           key=lambda c: (-self.frequenzeTag[c], self.valori["Tags"][c]))
+        for codice in candidati[:liberi]:
+            self.bitTag[codice] = len(self.bitTag)
+        return self
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, DICTIONARY_FILE), "w") as f:
+            json.dump({"values": self.valori, "tag_counts": self.frequenzeTag,
+                       "tag_bits": sorted(self.bitTag, key=self.bitTag.get)}, f)
+
+    @staticmethod
+    def load(directory):
+        dizionari = DatasetDictionaries()
+        with open(os.path.join(directory, DICTIONARY_FILE)) as f:
+            salvati = json.load(f)
+        # L'ordine salvato è quello dei codici: va ripristinato così com'è, senza riordinare
+        for c, lista in salvati["values"].items():
+            dizionari.valori[c] = lista
+            dizionari.codici[c] = {v: i for i, v in enumerate(lista)}
+        dizionari.frequenzeTag = salvati["tag_counts"]
+        dizionari.bitTag = {codice: bit for bit, codice in enumerate(salvati["tag_bits"])}
+        return dizionari
+
+    def codeOf(self, colonna, valore):
+        return self.codici[colonna].get(valore)
+
+    # Coppie (tag, occorrenze) senza alcun job Spark
+    def tagFrequencies(self):
+        return list(zip(self.valori["Tags"], self.frequenzeTag))
+
+    # Espressioni letterali: Spark le valuta una volta sola (constant folding), non riga per riga
+    def code(self, colonna, valore):
+        codici = self.codici[colonna]
+        if not codici:
+            return lit(None).cast("int")
+        mappa = map_from_arrays(array(*[lit(v) for v in codici]), array(*[lit(i) for i in codici.values()]))
+        return mappa[valore]
+
+    def value(self, colonna, codice):
+        valori = self.valori[colonna]
+        if not valori:
+            return lit(None).cast("string")
+        return array(*[lit(v) for v in valori])[codice]
+
+    # OR dei bit dei tag (in chiaro) di ogni recensione: 0 se nessuno dei suoi tag ha un bit
+    def tagMask(self, tags):
+        zero = lit(0).cast("long")
+        if not self.bitTag:
+            return zero
+        nomi = [lit(self.valori["Tags"][codice]) for codice in self.bitTag]
+        bit = map_from_arrays(array(*nomi), array(*[lit(1 << b).cast("long") for b in self.bitTag.values()]))
+        return aggregate(transform(tags, lambda tag: coalesce(bit[tag], zero)), zero, lambda acc, x: acc.bitwiseOR(x))
+
+    # Condizione "la recensione ha tutti questi tag" sul dataset caldo: i tag con un bit si controllano con un
+    # AND sulla maschera, gli altri cercando il codice intero nell'array. Un tag sconosciuto non trova nulla
+    def hasTags(self, tags):
+        codici = [self.codeOf("Tags", tag) for tag in tags]
+        if None in codici:
+            return lit(False)
+        maschera, condizione = 0, lit(True)
+        for codice in codici:
+            if codice in self.bitTag:
+                maschera |= 1 << self.bitTag[codice]
+            else:
+                condizione = condizione & array_contains(col("Tags"), codice)
+        if maschera:
+            condizione = condizione & (col("Tags_Mask").bitwiseAND(lit(maschera)) == lit(maschera))
+        return condizione
+
+    # Dal dataset completo (snapshot o batch) alle sole colonne calde, con i codici al posto dei nomi
+    def encode(self, dataset):
+        return dataset.select(
+            REVIEW_ID,
+            *[self.code(c, col(c)).alias(c) for c in ENCODED_COLUMNS],
+            transform("Tags", lambda tag: self.code("Tags", tag)).alias("Tags"),
+            self.tagMask(col("Tags")).alias("Tags_Mask"),
+            *PLAIN_COLUMNS)
+    # Riporta in chiaro le colonne codificate presenti in un DataFrame (dataset caldo o risultato di una query),
+    # lasciando le altre colonne al loro posto
+    def decode(self, df):
+        colonne = []
+        for c in df.columns:
+            if c in ENCODED_COLUMNS:
+                colonne.append(self.value(c, df[c]).alias(c))
+            elif c == "Tags":
+                colonne.append(transform(df[c], lambda tag: self.value("Tags", tag)).alias(c))
+            else:
+                colonne.append(df[c])
+        return df.select(*colonne)
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+from Utility import PATH_MONUMENT, EARTH_RADIUS_KM, haversine_vectorized
+
+
+def loadMonuments(path=PATH_MONUMENT):
+    return pd.read_csv(path, delimiter=",")
+
+
+# Indice spaziale sugli hotel e sui monumenti: BallTree con metrica haversine (coordinate in radianti)
+class HotelSpatialIndex:
+    def __init__(self, hotels, monuments):
+        # hotels: Hotel_Name, City_Hotel, Latitude, Longitude - monuments: City, Monument, lat, long
+        self.hotels = hotels.dropna(subset=["Latitude", "Longitude"]).reset_index(drop=True)
+        self.monuments = monuments.dropna(subset=["lat", "long"]).reset_index(drop=True)
+        self.hotelTree = BallTree(np.radians(self.hotels[["Latitude", "Longitude"]].to_numpy(dtype=float)),
+                                  metric="haversine")
+        self.monumentTree = BallTree(np.radians(self.monuments[["lat", "long"]].to_numpy(dtype=float)),
+                                     metric="haversine")
+        self.matrici = {}
+
+    # I k hotel più vicini a ogni monumento (o solo a quelli indicati), con un'unica interrogazione dell'albero
+    def nearestHotels(self, k=5, monuments=None):
+        df_m = self.monuments if monuments is None else self.monuments[self.monuments["Monument"].isin(monuments)]
+        k = min(k, len(self.hotels))
+        dist, idx = self.hotelTree.query(np.radians(df_m[["lat", "long"]].to_numpy(dtype=float)), k=k)
+        res = pd.DataFrame({
+            "Monument": np.repeat(df_m["Monument"].to_numpy(), k),
+            "Hotel_Name": self.hotels["Hotel_Name"].to_numpy()[idx.ravel()],
+            "Distance_km": dist.ravel() * EARTH_RADIUS_KM,
+        })
+        return res
+
+    # Tutti i monumenti entro radius_km da ogni hotel (o solo da quelli indicati), ordinati per distanza
+    def monumentsWithin(self, radius_km, hotels=None):
+        df_h = self.hotels if hotels is None else self.hotels[self.hotels["Hotel_Name"].isin(hotels)]
+        idx, dist = self.monumentTree.query_radius(np.radians(df_h[["Latitude", "Longitude"]].to_numpy(dtype=float)),
+                                                   r=radius_km / EARTH_RADIUS_KM, return_distance=True,
+                                                   sort_results=True)
+        counts = [len(i) for i in idx]
+        flat = np.concatenate(idx).astype(int) if counts else np.array([], dtype=int)
+        res = pd.DataFrame({
+            "Hotel_Name": np.repeat(df_h["Hotel_Name"].to_numpy(), counts),
+            "Monument": self.monuments["Monument"].to_numpy()[flat],
+            "Distance_km": (np.concatenate(dist) if counts else np.array([])) * EARTH_RADIUS_KM,
+        })
+        return res
+
+    # Matrice hotel x monumenti di una città, calcolata una volta sola e poi riutilizzata
+    def distanceMatrix(self, city):
+        if city not in self.matrici:
+            df_h = self.hotels[self.hotels["City_Hotel"] == city]
+            df_m = self.monuments[self.monuments["City"] == city]
+            distanze = haversine_vectorized(df_h["Latitude"].to_numpy()[:, None], df_h["Longitude"].to_numpy()[:, None],
+                                            df_m["lat"].to_numpy()[None, :], df_m["long"].to_numpy()[None, :])
+            self.matrici[city] = pd.DataFrame(distanze, index=df_h["Hotel_Name"].to_numpy(),
+                                              columns=df_m["Monument"].to_numpy())
+        return self.matrici[city]
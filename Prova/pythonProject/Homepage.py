@@ -1,8 +1,12 @@
+from concurrent.futures import as_completed
+from functools import partial
+
 import matplotlib.pyplot as plt
 import streamlit as st
 import wordcloud as wc
 
-from Backend import SparkBuilder
+from Backend import getSparkBuilder, submitQuery
+from Profiling import iniziaPagina, pannelloTempi
 from Utility import get_word_frequencies_dict, get_tags_frequencies_dict
 
 st.set_page_config(
@@ -13,22 +17,90 @@ st.set_page_config(
 )
 
 
-@st.cache_resource
+# Istanza condivisa dal registro di Backend: dataset e cache vengono costruiti una sola volta per processo.
+# Avviando con 'python Server.py' sono già in costruzione prima che si colleghi la prima sessione
 def getSpark():
-    return SparkBuilder("appName")
+    return getSparkBuilder()
+
+
+# Segnaposto di una sezione, riempito quando arriva il risultato della sua query
+def placeholder():
+    slot = st.empty()
+    slot.caption("Loading...")
+    return slot
+
+
+def renderMap(slot, loglatdat):
+    # Rinominiamo le colonne del dataset
+    loglatdat.rename(columns={'first(lat)': 'lat'}, inplace=True)
+    loglatdat.rename(columns={'first(lng)': 'lon'}, inplace=True)
+    loglatdat.drop(columns=['Hotel_Name'], inplace=True)
+
+    # Mappiamo i primi punti
+    with slot.container():
+        st.map(data=loglatdat, use_container_width=True)
+
+
+def renderMetric(slot, value):
+    with slot.container():
+        st.metric("", value)
+
+
+def renderCountries(slot, countryHotel):
+    listCountry = ''
+    for i in countryHotel:
+        listCountry += "- " + i + "\n"
+    with slot.container():
+        st.markdown(listCountry)
+
+
+def renderNationality(slot, nationalityReviewer):
+    totalNationality = len(nationalityReviewer)
+    nationalityReviewer = nationalityReviewer.T
+    with slot.container():
+        st.dataframe(
+            data=nationalityReviewer,
+            hide_index=False,
+        )
+        st.subheader("Total Nationality")
+        st.metric("", totalNationality)
+
+
+def renderWords(slot, result):
+    dswords, (max_w, min_w) = result
+    wordset = get_word_frequencies_dict(dswords)
+    wordgraph = wc.WordCloud(width=800, height=250, background_color='white', max_font_size=200).generate_from_frequencies(wordset)
+    fig, ax = plt.subplots(figsize=(14, 10))
+    ax.imshow(wordgraph)
+    plt.axis("off")
+    with slot.container():
+        st.pyplot(fig)
+        st.markdown(f"{max_w['word'].upper()} was the **most** used word. Meanwhile {min_w['word'].upper()} was the **least** used word.")
+
+
+def renderLongest(positiveSlot, negativeSlot, result):
+    longest, shortest = result
+    positiveSlot.markdown(f"The review is: {longest}")
+    negativeSlot.markdown(f"The review is: {shortest}")
+
+
+def renderTags(slot, dstags):
+    tagfre = get_tags_frequencies_dict(dstags)
+    taggraph = wc.WordCloud(width=800, height=250, background_color='white', max_font_size=200).generate_from_frequencies(tagfre)
+    fig1, ax1 = plt.subplots(figsize=(14,10))
+    ax1.imshow(taggraph)
+    plt.axis("off")
+    with slot.container():
+        st.pyplot(fig1)
+        st.markdown(f"{dstags.iat[0, 0]} was the most used tag!")
 
 
 def main():
 
     with st.spinner('Loading... Please wait...'):
         spark = getSpark()
-        loglatdat = spark.query.getlatlong()
-        totalNumberHotels = spark.query.getNumOfHotel()
-        countryHotel = spark.query.getCountryHotel()
-        dswords = spark.query.wordsFrequency()
-        dstags = spark.query.mostAndLeastTagUsed()
-        nationalityReviewer = spark.query.getReviewerNationality().toPandas()
-        longest, shortest = spark.query.longestShortestReviews()
+    iniziaPagina(spark, "Homepage")
+    query = spark.query
 
     st.title("Hotel Dataset Analysis")
     st.subheader("Geographic Locations")
@@ -42,26 +114,18 @@ def main():
                 "The locations of these points correspond to the geographical positions of the hotels.")
 
     st.divider()
-
-    # Rinominiamo le colonne del dataset
-    loglatdat.rename(columns={'first(lat)': 'lat'}, inplace=True)
-    loglatdat.rename(columns={'first(lng)': 'lon'}, inplace=True)
-    loglatdat.drop(columns=['Hotel_Name'], inplace=True)
-
-    # Mappiamo i primi punti
-    st.map(data=loglatdat, use_container_width=True)
-
+    mapSlot = placeholder()
     st.divider()
 
     col1, col2 = st.columns(2)
 
     with col1:
         st.subheader("Total Reviews")
-        st.metric("", spark.dataset.count())
+        reviewsSlot = placeholder()
 
     with col2:
         st.subheader("Total number of Hotels")
-        st.metric("", totalNumberHotels)
+        hotelsSlot = placeholder()
 
     st.divider()
 
@@ -69,49 +133,49 @@ def main():
 
     with col3:
         st.subheader("Country of Hotels")
-        listCountry = ''
-        for i in countryHotel:
-            listCountry += "- " + i['Country_Hotel'] + "\n"
-        st.markdown(listCountry)
+        countriesSlot = placeholder()
     with col4:
         st.subheader("Reviewer Nationality")
-        totalNationality = len(nationalityReviewer)
-        nationalityReviewer = nationalityReviewer.T
-        st.dataframe(
-            data=nationalityReviewer,
-            hide_index=False,
-        )
-        st.subheader("Total Nationality")
-        st.metric("", totalNationality)
+        nationalitySlot = placeholder()
 
     st.divider()
     st.subheader("The Most and the Least used word in a review")
-    wordset = get_word_frequencies_dict(dswords)
-    wordgraph = wc.WordCloud(width=800, height=250, background_color='white', max_font_size=200).generate_from_frequencies(wordset)
-    fig, ax = plt.subplots(figsize=(14, 10))
-    ax.imshow(wordgraph)
-    plt.axis("off")
-    st.pyplot(fig)
-
-    max_w, min_w = spark.query.maxMinFrequency()
-
-    st.markdown(f"{max_w['word'].upper()} was the **most** used word. Meanwhile {min_w['word'].upper()} was the **least** used word.")
-
+    wordsSlot = placeholder()
     st.divider()
     st.subheader("The Longest Positive Reviews in the Dataset")
-    st.markdown(f"The review is: {longest.collect()[0][0]}")
+    positiveSlot = placeholder()
     st.divider()
     st.subheader("The Longest Negative Reviews in the Dataset")
-    st.markdown(f"The review is: {shortest.collect()[0][0]}")
+    negativeSlot = placeholder()
     st.divider()
     st.subheader("The Most and the Least used Tag")
-    tagfre = get_tags_frequencies_dict(dstags)
-    taggraph = wc.WordCloud(width=800, height=250, background_color='white', max_font_size=200).generate_from_frequencies(tagfre)
-    fig1, ax1 = plt.subplots(figsize=(14,10))
-    ax1.imshow(taggraph)
-    plt.axis("off")
-    st.pyplot(fig1)
-    st.markdown(f"{dstags.collect()[0][0]} was the most used tag!")
+    tagsSlot = placeholder()
     st.divider()
 
+    # Le query partono tutte insieme nel pool FAIR della pagina; ogni sezione viene disegnata appena
+    # arriva il suo risultato (i widget Streamlit si creano solo da questo thread)
+    sections = {
+        submitQuery(spark, query.getlatlong): partial(renderMap, mapSlot),
+        submitQuery(spark, query.getTotalReviews): partial(renderMetric, reviewsSlot),
+        submitQuery(spark, query.getNumOfHotel): partial(renderMetric, hotelsSlot),
+        submitQuery(spark, query.getCountryHotel): partial(renderCountries, countriesSlot),
+        submitQuery(spark, lambda: query.getReviewerNationality().toPandas()): partial(renderNationality,
+                                                                                       nationalitySlot),
+        submitQuery(spark, lambda: (query.topWordsFrequency(), query.maxMinFrequency())): partial(renderWords,
+                                                                                                  wordsSlot),
+        submitQuery(spark, lambda: tuple(df.first()[0] for df in query.longestShortestReviews())):
+            partial(renderLongest, positiveSlot, negativeSlot),
+        submitQuery(spark, query.topTagsFrequency): partial(renderTags, tagsSlot),
+    }
+    # Una query fallita mostra l'errore nella propria sezione: le altre vengono disegnate comunque
+    for future in as_completed(sections):
+        render = sections[future]
+        try:
+            render(future.result())
+        except Exception as e:
+            for slot in render.args:
+                slot.error(f"Section not available: {e}")
+
+    pannelloTempi(spark)
+
 main()
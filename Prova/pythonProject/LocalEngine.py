@@ -0,0 +1,459 @@
+import os
+import string
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyspark.sql import Row
+
+from Backend import QueryManager, getSparkBuilder
+from Encoding import COLD_COLUMNS, TEXT_NOTHING, TEXT_PLACEHOLDER
+from SearchIndex import ReviewSearchIndex, calcolaIndiceRicercaLocale
+from Utility import (PATH_DS, PATH_SNAPSHOT, WORD_INDEX_DIR, SCORED_DIR, WORDCLOUD_SIZE, dataset_fingerprint,
+                     read_fingerprint, is_snapshot_valid, get_stop_words, REVIEW_ID, SEARCH_INDEX_DIR,
+                     write_fingerprint, COLD_LOOKUP_MAX_IDS, SNAPSHOT_LAYOUT)
+
+
+# DataFrame pandas con i metodi dei DataFrame Spark usati dalle pagine: toPandas(), collect() e first()
+class LocalFrame(pd.DataFrame):
+    @property
+    def _constructor(self):
+        return LocalFrame
+
+    def toPandas(self):
+        return pd.DataFrame(self).reset_index(drop=True)
+
+    # Row di Spark: accesso sia per posizione sia per nome di colonna, come nelle pagine
+    def collect(self):
+        return [Row(**record) for record in self.to_dict("records")]
+
+    def first(self):
+        return Row(**self.iloc[0].to_dict()) if len(self) else None
+
+
+def _frame(df):
+    return LocalFrame(df.reset_index(drop=True))
+
+
+def _estremi(df, gruppo, valore, parola):
+    # Equivalente di max/min(struct(valore, parola)): ordinamento per valore e poi per parola
+    ordinato = df.sort_values([gruppo, valore, parola], na_position="first")
+    return ordinato.drop_duplicates(gruppo, keep="last"), ordinato.drop_duplicates(gruppo, keep="first")
+
+
+def _leggiSnapshot(path, columns=None):
+    dataset = pd.read_parquet(path, columns=columns)
+    # Le colonne di partizione arrivano come categorie: tornano ai tipi del dataset Spark
+    for colonna, tipo in (("Country_Hotel", object), ("Review_Year", "Int32")):
+        if colonna in dataset:
+            dataset[colonna] = dataset[colonna].astype(tipo)
+    return dataset
+
+
+# Stessa logica di calcolaIndiceParole, usata solo se lo snapshot non contiene l'indice già calcolato da Spark
+def calcolaIndiceParoleLocale(dataset):
+    testo = (dataset["Negative_Review"] + " " + dataset["Positive_Review"]).str.lower().str.split(r"\s+", regex=True)
+    words = dataset[["City_Hotel", "Review_Year"]].assign(word=testo).explode("word").dropna(subset=["word"])
+    return words.groupby(["word", "City_Hotel", "Review_Year"], dropna=False).size() \
+        .rename("Frequency").reset_index()
+
+
+# Motore senza JVM per dataset che stanno in memoria: legge lo snapshot Parquet già pulito da Spark
+# e risponde con pandas, con gli stessi metodi (e gli stessi nomi di colonna) del QueryManager Spark
+class LocalBuilder:
+    def __init__(self, path=PATH_DS, snapshot=PATH_SNAPSHOT, validate=False):
+        self.path = path
+        self.snapshot = snapshot
+        self.profiler = None
+        self.ingestion = None
+        self.malformed = 0
+        self.closed = False
+        self.fingerprint = read_fingerprint(snapshot)
+        if self.fingerprint is None:
+            raise FileNotFoundError(f"Snapshot non trovato in {snapshot}: crearlo una volta con 'python Backend.py'")
+        if self.fingerprint.get("layout") != SNAPSHOT_LAYOUT:
+            raise ValueError("Lo snapshot ha una struttura precedente: ricrearlo con il motore Spark")
+        # Il controllo sul contenuto del CSV richiede di rileggerlo tutto: solo su richiesta
+        if validate and not is_snapshot_valid(snapshot, dataset_fingerprint(path)):
+            raise ValueError("Lo snapshot non corrisponde al CSV: ricrearlo con il motore Spark")
+        self.loadDataset()
+
+    # Come il dataset caldo di Spark: in memoria solo le colonne usate dalle query, con i tipi dei testi
+    # (Negative_Kind e Positive_Kind, salvati nello snapshot) al posto dei testi, letti per Review_Id quando servono
+    def loadDataset(self):
+        start = time.perf_counter()
+        schema = ds.dataset(self.snapshot, format="parquet", partitioning="hive").schema
+        colonne = [c for c in schema.names if c not in COLD_COLUMNS]
+        self.dataset = _leggiSnapshot(self.snapshot, colonne)
+        self.loadTime = time.perf_counter() - start
+        self.query = LocalQueryManager(self)
+
+    def snapshotPath(self, name):
+        return os.path.join(self.snapshot, name)
+
+    # Snapshot completo, con i testi: solo per le strutture derivate che Spark non ha già salvato
+    def fullDataset(self):
+        return _leggiSnapshot(self.snapshot)
+
+    def coldTable(self, *columns):
+        return _leggiSnapshot(self.snapshot, [REVIEW_ID, *(columns or COLD_COLUMNS)])
+
+    # Aggiunge i testi alle righe (poche) di una query: il filtro su Review_Id usa le statistiche dei row group
+    def fetchText(self, rows, *columns):
+        ids = [int(i) for i in rows[REVIEW_ID].unique()]
+        if len(ids) > COLD_LOOKUP_MAX_IDS:
+            return rows.merge(self.coldTable(*columns), on=REVIEW_ID)
+        testi = pq.read_table(self.snapshot, columns=[REVIEW_ID, *(columns or COLD_COLUMNS)],
+                              filters=[(REVIEW_ID, "in", ids)]).to_pandas()
+        return rows.merge(testi, on=REVIEW_ID)
+
+    def warmUp(self):
+        self.rows = len(self.dataset)
+        self.query.getCatalog()
+        # Ricalcolare l'indice delle parole in pandas vorrebbe dire rileggere tutti i testi all'avvio:
+        # si carica solo se Spark lo ha già salvato, altrimenti lo costruisce la prima pagina che lo usa
+        if self.query.isDerivedValid(self.snapshotPath(WORD_INDEX_DIR)):
+            self.query.getIndiceParole()
+        return self.rows
+
+    def healthCheck(self):
+        return {
+            "alive": not self.closed,
+            "dataset_cached": not self.closed,
+            "rows": len(self.dataset),
+            "version": f"{self.fingerprint['sha256'][:12]}+{self.fingerprint.get('batches', 0)}",
+            "ingestion": False,
+            "malformed": self.malformed,
+            "load_seconds": round(self.loadTime, 3),
+        }
+
+    def closeConnection(self):
+        self.closed = True
+
+
+class LocalQueryManager(QueryManager):
+    def __init__(self, spark: LocalBuilder):
+        super().__init__(spark)
+        self.classificate = None
+        # Il dataset è in memoria: le risposte sono sempre esatte, anche con PROVA_APPROXIMATE=1
+        self.approssimato = False
+
+    # Strutture del solo motore Spark (aggregati del dataset caldo in cache, sketch calcolati con mapInPandas):
+    # i metodi del motore pandas calcolano i risultati direttamente dal dataset
+    def getAggregati(self):
+        raise NotImplementedError("Gli aggregati precalcolati esistono solo nel motore Spark")
+
+    def getSketches(self):
+        raise NotImplementedError("Gli sketch esistono solo nel motore Spark")
+
+    def aggiornaConBatch(self, batch, dictionaries, numero, fingerprint):
+        raise NotImplementedError("Il motore pandas non riceve batch in streaming")
+
+    def countryInformationApprossimata(self):
+        return self.countryInformation()
+
+    def getCorrelationBetweenReviewAndSeasonApprossimata(self, *args, **kwargs):
+        return self.getCorrelationBetweenReviewAndSeason()
+
+    def getIndiceParole(self):
+        with self.lock:
+            if self.indiceParole is None:
+                path = self.spark.snapshotPath(WORD_INDEX_DIR)
+                if self.isDerivedValid(path):
+                    self.indiceParole = pd.read_parquet(path)
+                else:
+                    self.indiceParole = calcolaIndiceParoleLocale(self.spark.fullDataset())
+        return self.indiceParole
+
+    # L'indice di ricerca ha lo stesso formato di quello costruito da Spark, che viene riusato se è valido
+    def getSearchIndex(self):
+        with self.lock:
+            if self.indiceRicerca is None:
+                path = self.spark.snapshotPath(SEARCH_INDEX_DIR)
+                if not self.isDerivedValid(path):
+                    calcolaIndiceRicercaLocale(self.spark.fullDataset(), path)
+                    write_fingerprint(path, self.spark.fingerprint)
+                self.indiceRicerca = ReviewSearchIndex(path, self.spark.snapshot)
+        return self.indiceRicerca
+
+    def righeCatalogo(self):
+        df = self.spark.dataset[["Country_Hotel", "City_Hotel", "Hotel_Name"]]
+        return df[df["Hotel_Name"].notna()].drop_duplicates().to_dict("records")
+
+    def getTags(self):
+        return list(self.spark.dataset["Tags"].explode().dropna().unique())
+
+    def getTotalReviews(self):
+        return len(self.spark.dataset)
+
+    def countryInformation(self):
+        df = self.spark.dataset
+        res = df.groupby("City_Hotel", dropna=False).agg(
+            Total_Reviews=("Hotel_Name", "size"),
+            Number_Hotel=("Hotel_Name", "nunique"),
+            Average_Score=("Average_Score", "mean"),
+        )
+        vuoti = [TEXT_PLACEHOLDER, TEXT_NOTHING]
+        res["TotalN"] = (~df["Negative_Kind"].isin(vuoti)).groupby(df["City_Hotel"], dropna=False).sum()
+        res["TotalP"] = (~df["Positive_Kind"].isin(vuoti)).groupby(df["City_Hotel"], dropna=False).sum()
+        return _frame(res.reset_index())
+
+    def wordsFrequency(self):
+        return _frame(self.getIndiceParole().groupby("word", as_index=False)["Frequency"].sum())
+
+    def maxMinFrequency(self):
+        df = self.wordsFrequency().sort_values(["Frequency", "word"], na_position="first")
+        return df.iloc[-1][["Frequency", "word"]], df.iloc[0][["Frequency", "word"]]
+
+    def topWordsFrequency(self, n=WORDCLOUD_SIZE):
+        words = self.getIndiceParole()
+        words = words.assign(word=words["word"].str.strip(string.punctuation))
+        lettere = words["word"].str.contains(r"[^\W\d_]", regex=True, na=False)
+        words = words[lettere & ~words["word"].isin(get_stop_words())]
+        words = words.groupby("word", as_index=False)["Frequency"].sum()
+        return words.sort_values(["Frequency", "word"], ascending=[False, True]).head(n).reset_index(drop=True)
+
+    def topTagsFrequency(self, n=WORDCLOUD_SIZE):
+        df = self.mostAndLeastTagUsed()
+        return df[df["word"] != ""].head(n).toPandas()
+
+    def getlatlong(self):
+        df = self.spark.dataset.groupby("Hotel_Name", dropna=False, as_index=False) \
+            .agg(lng=("lng", "first"), lat=("lat", "first"))
+        return df.rename(columns={"lng": "first(lng)", "lat": "first(lat)"})[["Hotel_Name", "first(lng)", "first(lat)"]]
+
+    def getReviewerNationality(self):
+        return _frame(self.spark.dataset[["Reviewer_Nationality"]].drop_duplicates())
+
+    def mostLeastUsedWordsByCity(self):
+        df = self.getIndiceParole().rename(columns={"word": "Words"})
+        word_frequency = df.groupby(["City_Hotel", "Words"], dropna=False, as_index=False)["Frequency"].sum()
+        maxword, minword = _estremi(word_frequency, "City_Hotel", "Frequency", "Words")
+        return (_frame(maxword[["City_Hotel", "Frequency", "Words"]]),
+                _frame(minword[["City_Hotel", "Words", "Frequency"]]))
+
+    def hotelHighestAravarageScore(self):
+        return _frame(self.spark.dataset.groupby("Hotel_Name", dropna=False, as_index=False)
+                      .agg(Avarage_Score=("Average_Score", "mean")))
+
+    def hotelStatistics(self):
+        df = self.spark.dataset
+        df = df.assign(Positive=(df["Positive_Kind"] != TEXT_PLACEHOLDER) & df["Positive_Kind"].notna(),
+                       Negative=(df["Negative_Kind"] != TEXT_PLACEHOLDER) & df["Negative_Kind"].notna())
+        res = df.groupby("Hotel_Name", dropna=False, as_index=False).agg(
+            Total_Reviews=("Hotel_Name", "size"),
+            Total_Positive_Reviews=("Positive", "sum"),
+            Total_Negative_Reviews=("Negative", "sum"),
+            Max_Reviewer_Score=("Reviewer_Score", "max"),
+            Min_Reviewer_Score=("Reviewer_Score", "min"),
+            Avg_Reviewer_Score=("Reviewer_Score", "mean"),
+            Latitude=("lat", "first"),
+            Longitude=("lng", "first"),
+            Avg_Additional_Number_of_Scoring=("Additional_Number_of_Scoring", "mean"),
+        )
+        return _frame(res)
+
+    def getHotelProfiles(self):
+        with self.lock:
+            if self.profili is None:
+                df = self.spark.dataset
+                df = df[df["days_since_review"].notna()]
+                # Ultima recensione: days_since_review minimo, a parità il Review_Id minimo come in Spark
+                ultime = df.sort_values(["Hotel_Name", "days_since_review", REVIEW_ID]) \
+                    .drop_duplicates("Hotel_Name")[["Hotel_Name", REVIEW_ID, "days_since_review"]]
+                ultime = self.spark.fetchText(ultime, "Positive_Review", "Negative_Review")
+                ultime = ultime[["Hotel_Name", "Positive_Review", "Negative_Review", "days_since_review"]]
+                ultime.columns = ["Hotel_Name", "Positive", "Negative", "DSR"]
+                profili = self.hotelStatistics().toPandas().merge(ultime, on="Hotel_Name", how="left")
+                self.profili = profili.set_index("Hotel_Name", drop=False).rename_axis(None)
+        return self.profili
+
+    def longestShortestReviews(self):
+        df = self.spark.dataset
+        positive = df["Review_Total_Positive_Word_Counts"]
+        negative = df["Review_Total_Negative_Word_Counts"]
+        positive = self.spark.fetchText(df.loc[positive == positive.max()], "Positive_Review")
+        negative = self.spark.fetchText(df.loc[negative == negative.max()], "Negative_Review")
+        return (_frame(positive[["Positive_Review", "Review_Total_Positive_Word_Counts"]]),
+                _frame(negative[["Negative_Review", "Review_Total_Negative_Word_Counts"]]))
+
+    def mostAndLeastTagUsed(self):
+        tags = self.spark.dataset["Tags"].explode().dropna()
+        frequenza_tag = tags.value_counts().rename_axis("word").reset_index(name="count")
+        return _frame(frequenza_tag.sort_values(["count", "word"], ascending=[False, True]))
+
+    def tagStatistics(self, tags, city=None, country=None, hotel=None, by=()):
+        df = self.spark.dataset
+        richiesti = set(tags)
+        filtro = df["Tags"].map(lambda t: t is not None and richiesti.issubset(t))
+        for colonna, valore in (("City_Hotel", city), ("Country_Hotel", country), ("Hotel_Name", hotel)):
+            if valore is not None:
+                filtro &= df[colonna] == valore
+        df = df[filtro]
+        if by:
+            res = df.groupby(list(by), as_index=False).agg(
+                Total_Reviews=("Reviewer_Score", "size"),
+                Avg_Reviewer_Score=("Reviewer_Score", "mean"),
+                Min_Reviewer_Score=("Reviewer_Score", "min"),
+                Max_Reviewer_Score=("Reviewer_Score", "max"),
+                Avg_Average_Score=("Average_Score", "mean"),
+            )
+            return _frame(res.sort_values(list(by)))
+        # Senza raggruppamento una sola riga, anche se nessuna recensione ha i tag (come l'agg di Spark)
+        return _frame(pd.DataFrame({
+            "Total_Reviews": [len(df)],
+            "Avg_Reviewer_Score": [df["Reviewer_Score"].mean()],
+            "Min_Reviewer_Score": [df["Reviewer_Score"].min()],
+            "Max_Reviewer_Score": [df["Reviewer_Score"].max()],
+            "Avg_Average_Score": [df["Average_Score"].mean()],
+        }))
+
+    # Il modello è una pipeline Spark ML: le recensioni classificate si leggono da quelle salvate dal motore Spark,
+    # che è l'unico a poterle calcolare (build=True)
+    def getScoredDataset(self, build=False):
+        with self.lock:
+            if self.classificate is None:
+                path = self.spark.snapshotPath(SCORED_DIR)
+                if not self.isDerivedValid(path):
+                    raise FileNotFoundError("Recensioni classificate non disponibili: eseguire 'python Sentiment.py "
+                                            "score'")
+                self.classificate = pd.read_parquet(path)
+        return self.classificate
+
+    def predictedSentimentBy(self, *keys):
+        df = self.getScoredDataset()
+        def conta(valore):
+            # Le recensioni segnaposto hanno sentiment nullo e non vengono contate
+            return sum(df[c].eq(valore).fillna(False).astype(int) for c in ("Positive_Sentiment", "Negative_Sentiment"))
+
+        df = df.assign(Predicted_Positive=conta(1), Predicted_Negative=conta(0))
+        res = df.groupby(list(keys), dropna=False).agg(
+            Predicted_Positive=("Predicted_Positive", "sum"),
+            Predicted_Negative=("Predicted_Negative", "sum"),
+            Avg_Positive_Confidence=("Positive_Confidence", "mean"),
+            Avg_Negative_Confidence=("Negative_Confidence", "mean"),
+        )
+        return _frame(res.sort_index(na_position="first").reset_index())
+
+    def getClassificationDataFrame(self):
+        df = self.spark.coldTable("Positive_Review", "Negative_Review")
+        positive = df.loc[df["Positive_Review"].notna() & (df["Positive_Review"] != "No Positive"), ["Positive_Review"]]
+        negative = df.loc[df["Negative_Review"].notna() & (df["Negative_Review"] != "No Negative"), ["Negative_Review"]]
+        return _frame(pd.concat([positive.set_axis(["Review"], axis=1).assign(Sentiment=1),
+                                 negative.set_axis(["Review"], axis=1).assign(Sentiment=0)]))
+
+    def getDatasetForClassification(self):
+        dataset = self.getClassificationDataFrame()
+        print(len(dataset))
+        return dataset.toPandas()
+
+    def getNumberOfDifferentReviewerNationality(self):
+        res = self.spark.dataset.groupby("City_Hotel", dropna=False)["Reviewer_Nationality"].nunique()
+        return _frame(res.rename("Different_Nationality").sort_index(na_position="first").reset_index())
+
+    def getValutationByYearAMonth(self):
+        df = self.spark.dataset.rename(columns={"Average_Score": "avg(Average_Score)"})
+        per_year = df.groupby("Review_Year", dropna=False, as_index=False)["avg(Average_Score)"].mean()
+        per_month = df.groupby(["Review_Year", "Review_Month"], dropna=False, as_index=False)["avg(Average_Score)"] \
+            .mean()
+        return (per_year.sort_values("Review_Year", na_position="first").reset_index(drop=True),
+                per_month.sort_values(["Review_Year", "Review_Month"], na_position="first").reset_index(drop=True))
+
+    def getTotalReviewByYearAMonth(self):
+        df = self.spark.dataset
+        per_year = df.groupby("Review_Year", dropna=False).size().rename("count").reset_index()
+        per_month = df.groupby(["Review_Year", "Review_Month"], dropna=False).size().rename("count").reset_index()
+        return (_frame(per_year.sort_values("Review_Year", na_position="first")),
+                _frame(per_month.sort_values(["Review_Year", "Review_Month"], na_position="first")))
+
+    def avarageNegativeAndPositveWordsForMonthAndYear(self):
+        gruppi = self.spark.dataset.groupby(["Review_Year", "Review_Month"], dropna=False)
+        positive = gruppi["Review_Total_Positive_Word_Counts"].mean().rename("Avarage").reset_index()
+        negative = gruppi["Review_Total_Negative_Word_Counts"].mean().rename("Avarage").reset_index()
+        ordine = ["Review_Year", "Review_Month"]
+        return (_frame(positive.sort_values(ordine, na_position="first")),
+                _frame(negative.sort_values(ordine, na_position="first")))
+
+    def getMostAndLeastUsedWordPerYear(self):
+        df = self.getIndiceParole().rename(columns={"word": "Words", "Frequency": "count"})
+        word_counts_per_year = df.groupby(["Review_Year", "Words"], dropna=False, as_index=False)["count"].sum()
+        most, least = _estremi(word_counts_per_year, "Review_Year", "count", "Words")
+        colonne = {"Words": "first(Words)"}
+        return (_frame(most.sort_values("Review_Year")[["Review_Year", "Words"]].rename(columns=colonne)),
+                _frame(least.sort_values("Review_Year")[["Review_Year", "Words"]].rename(columns=colonne)))
+
+    def getCorrelationBetweenReviewAndSeason(self):
+        df = self.spark.dataset
+        month = df["Review_Month"]
+        season = np.select([month.between(3, 5), month.between(6, 8), month.between(9, 11)],
+                           ["Spring", "Summer", "Autumn"], "Winter")
+        res = df.assign(Season=season).groupby("Season", as_index=False).agg(
+            Total=("Season", "size"), AScore=("Average_Score", "mean"))
+        return _frame(res.sort_values("Season"))
+
+
+# Metodi confrontati tra i due motori, con gli argomenti di prova
+METODI_PARITA = [
+    "countryInformation", "wordsFrequency", "maxMinFrequency", "topWordsFrequency", "topTagsFrequency", "getlatlong",
+    "getNumOfHotel", "getTotalReviews", "getCountryHotel", "getCityHotel", "getHotelName", "getReviewerNationality",
+    "mostLeastUsedWordsByCity", "hotelStatistics", "getHotelProfiles", "longestShortestReviews",
+    "mostAndLeastTagUsed", "getNumberOfDifferentReviewerNationality", "getValutationByYearAMonth",
+    "getTotalReviewByYearAMonth", "avarageNegativeAndPositveWordsForMonthAndYear", "getMostAndLeastUsedWordPerYear",
+    "getCorrelationBetweenReviewAndSeason",
+]
+
+
+def _comeTabella(value):
+    if hasattr(value, "toPandas"):
+        value = value.toPandas()
+    if isinstance(value, pd.Series):
+        value = value.to_frame().T
+    if isinstance(value, pd.DataFrame):
+        value = pd.DataFrame(value).reset_index(drop=True)
+        # L'ordine delle righe non fa parte del contratto dei metodi: si ordina sulle colonne non decimali
+        chiavi = [c for c in value.columns if not pd.api.types.is_float_dtype(value[c])] or list(value.columns)
+        value = value.sort_values(chiavi, na_position="first", key=lambda c: c.astype(str))
+        return value.reset_index(drop=True)
+    if hasattr(value, "asDict"):
+        return pd.DataFrame([value.asDict()])
+    return value
+
+
+def _uguali(a, b):
+    a, b = _comeTabella(a), _comeTabella(b)
+    if isinstance(a, pd.DataFrame) and isinstance(b, pd.DataFrame):
+        try:
+            pd.testing.assert_frame_equal(a, b, check_dtype=False, check_exact=False, rtol=1e-4)
+            return True, ""
+        except AssertionError as e:
+            return False, str(e).splitlines()[0]
+    return a == b, f"{a!r} != {b!r}"
+
+
+# Verifica di parità: ogni metodo deve restituire gli stessi dati sui due motori
+def confrontaMotori(spark_builder, local_builder, metodi=METODI_PARITA):
+    differenze = {}
+    for name in metodi:
+        attesi = getattr(spark_builder.query, name)()
+        ottenuti = getattr(local_builder.query, name)()
+        coppie = zip(attesi, ottenuti) if isinstance(attesi, tuple) else [(attesi, ottenuti)]
+        for i, (a, b) in enumerate(coppie):
+            ok, dettaglio = _uguali(a, b)
+            print(f"{'OK  ' if ok else 'DIFF'} {name}[{i}] {dettaglio}")
+            if not ok:
+                differenze[f"{name}[{i}]"] = dettaglio
+    return differenze
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    local = LocalBuilder()
+    local.warmUp()
+    print(f"Motore pandas pronto in {time.perf_counter() - start:.2f}s ({len(local.dataset)} recensioni, "
+          f"snapshot letto in {local.loadTime:.2f}s)")
+    if len(sys.argv) > 1 and sys.argv[1] == "parity":
+        spark = getSparkBuilder(engine="spark")
+        raise SystemExit(1 if confrontaMotori(spark, local) else 0)
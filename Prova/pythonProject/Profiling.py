@@ -0,0 +1,263 @@
+import functools
+import json
+import pickle
+import queue
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from urllib.request import urlopen
+
+import pandas as pd
+from pyspark.sql import DataFrame
+
+from Utility import PROFILING_LOG
+
+# Metriche per stage lette dalla REST API della Spark UI (resultSize = byte inviati al driver)
+STAGE_METRICS = ("numTasks", "inputRecords", "shuffleReadRecords", "shuffleWriteRecords", "resultSize")
+# Attesa prima di leggere job e stage di una chiamata: il listener bus di Spark li registra in modo asincrono
+METRICS_DELAY_S = 1.0
+# Attesa massima per job ancora in esecuzione (ad esempio avviati in un thread dalla chiamata)
+METRICS_MAX_WAIT_S = 60.0
+PANEL_COLUMNS = ["method", "wall_s", "jobs", "stages", "shuffle_read_records", "result_bytes", "cache_hit", "lazy"]
+
+
+def dimensioneRisultato(result):
+    if isinstance(result, pd.DataFrame):
+        return int(result.memory_usage(deep=True).sum())
+    if isinstance(result, DataFrame):
+        return 0
+    if isinstance(result, (tuple, list)) and any(isinstance(item, DataFrame) for item in result):
+        return sum(dimensioneRisultato(item) for item in result)
+    try:
+        return len(pickle.dumps(result))
+    except Exception:
+        return None
+
+
+def isLazy(result):
+    if isinstance(result, (tuple, list)):
+        return any(isLazy(item) for item in result)
+    return isinstance(result, DataFrame)
+
+
+# Misura ogni chiamata ai metodi del QueryManager: tempo, job e stage Spark, righe scambiate nello shuffle,
+# byte portati sul driver. Ogni chiamata usa un job group dedicato per attribuirle i job che ha lanciato.
+# Il tempo viene registrato subito; le metriche Spark le raccoglie un thread separato, a job conclusi,
+# così le chiamate alla REST API non rallentano la pagina
+class QueryProfiler:
+    def __init__(self, session, log_path=None, max_records=5000):
+        self.sc = session.sparkContext
+        self.log_path = log_path
+        self.records = deque(maxlen=max_records)
+        self.lock = threading.Lock()
+        # Streamlit esegue ogni sessione in un thread: pagina e annidamento sono per thread
+        self.local = threading.local()
+        self.query = None
+        self.pending = queue.Queue()
+        threading.Thread(target=self.collector, name="profiler-metrics", daemon=True).start()
+
+    def instrument(self, query):
+        self.query = query
+        for name in dir(type(query)):
+            method = getattr(query, name)
+            if not name.startswith("_") and callable(method):
+                setattr(query, name, self.wrap(name, method))
+        return query
+
+    def wrap(self, name, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            # Le chiamate interne (es. getH1H2statistic -> getHotelProfiles) rientrano in quella esterna
+            if getattr(self.local, "depth", 0):
+                return method(*args, **kwargs)
+            return self.call(name, method, args, kwargs)
+        return wrapper
+
+    # Hit della ResultCache nel thread corrente (zero finché la cache non è stata creata)
+    def cacheHits(self):
+        cache = getattr(self.query, "risultati", None)
+        return cache.threadHits() if cache is not None else {"memory": 0, "disk": 0, "miss": 0}
+
+    def call(self, name, method, args, kwargs):
+        group = f"profiler-{uuid.uuid4().hex}"
+        # setJobGroup imposta anche descrizione e interruptOnCancel: vanno ripristinati tutti e tre
+        proprieta = ("spark.jobGroup.id", "spark.job.description", "spark.job.interruptOnCancel")
+        previous = {key: self.sc.getLocalProperty(key) for key in proprieta}
+        hits = self.cacheHits()
+        self.sc.setJobGroup(group, name)
+        self.local.depth = 1
+        start = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        finally:
+            wall = time.perf_counter() - start
+            self.local.depth = 0
+            for key, value in previous.items():
+                self.sc.setLocalProperty(key, value)
+        dopo = self.cacheHits()
+        hits = {key: dopo[key] - hits[key] for key in dopo}
+        self.record(name, args, kwargs, wall, group, result, hits)
+        return result
+
+    def stageMetrics(self, stages):
+        totals = dict.fromkeys(STAGE_METRICS, 0)
+        url = self.sc.uiWebUrl
+        if not url:
+            return totals
+        for stage in stages:
+            try:
+                with urlopen(f"{url}/api/v1/applications/{self.sc.applicationId}/stages/{stage}", timeout=2) as r:
+                    attempts = json.load(r)
+            except (OSError, ValueError):
+                continue
+            for attempt in attempts:
+                for key in STAGE_METRICS:
+                    totals[key] += attempt.get(key, 0)
+        return totals
+
+    def record(self, name, args, kwargs, wall, group, result, hits):
+        entry = {
+            "timestamp": datetime.now().isoformat(timespec="milliseconds"),
+            "page": getattr(self.local, "page", None),
+            "run": getattr(self.local, "run", None),
+            "method": name,
+            "args": [repr(arg)[:80] for arg in args] + [f"{k}={v!r}"[:80] for k, v in kwargs.items()],
+            "wall_s": round(wall, 4),
+            # Metriche Spark: restano None finché il thread di raccolta non le ha lette
+            "jobs": None,
+            "stages": None,
+            "tasks": None,
+            "input_records": None,
+            "shuffle_read_records": None,
+            "shuffle_write_records": None,
+            "result_bytes": None,
+            "python_bytes": dimensioneRisultato(result),
+            # Risultato servito dalla ResultCache (memoria o disco) senza calcolare nulla
+            "cache_hit": hits["memory"] + hits["disk"] > 0 and hits["miss"] == 0,
+            # Un DataFrame restituito viene calcolato dopo, dalla pagina: il suo costo non è in wall_s
+            "lazy": isLazy(result),
+        }
+        with self.lock:
+            self.records.append(entry)
+        self.pending.put((time.monotonic(), entry, group))
+        return entry
+
+    def collector(self):
+        while True:
+            registrata, entry, group = self.pending.get()
+            time.sleep(max(0.0, registrata + METRICS_DELAY_S - time.monotonic()))
+            try:
+                self.completa(entry, group)
+            except Exception as e:
+                print(f"Metriche non raccolte per {entry['method']}: {e}")
+            finally:
+                self.pending.task_done()
+
+    # Job e stage del job group, letti quando nessun job del gruppo è più in esecuzione
+    def completa(self, entry, group):
+        tracker = self.sc.statusTracker()
+        scadenza = time.monotonic() + METRICS_MAX_WAIT_S
+        while True:
+            jobs = tracker.getJobIdsForGroup(group)
+            infos = [tracker.getJobInfo(job) for job in jobs]
+            if all(info is None or info.status != "RUNNING" for info in infos) or time.monotonic() > scadenza:
+                break
+            time.sleep(0.2)
+        stages = set()
+        for info in infos:
+            if info is not None:
+                stages.update(info.stageIds)
+        metrics = self.stageMetrics(sorted(stages))
+
+        with self.lock:
+            entry.update({
+                "jobs": len(jobs),
+                "stages": len(stages),
+                "tasks": metrics["numTasks"],
+                "input_records": metrics["inputRecords"],
+                "shuffle_read_records": metrics["shuffleReadRecords"],
+                "shuffle_write_records": metrics["shuffleWriteRecords"],
+                "result_bytes": metrics["resultSize"],
+            })
+            if self.log_path:
+                with open(self.log_path, "a") as f:
+                    f.write(json.dumps(entry) + "\n")
+
+    # Le chiamate successive del thread vengono attribuite a questa esecuzione della pagina
+    def startPage(self, page):
+        self.local.page = page
+        self.local.run = uuid.uuid4().hex
+        self.local.start = time.perf_counter()
+
+    # Contesto della pagina del thread corrente, da riportare nei thread che eseguono le sue query in parallelo
+    def pageContext(self):
+        return getattr(self.local, "page", None), getattr(self.local, "run", None), getattr(self.local, "start", None)
+
+    def restorePageContext(self, context):
+        self.local.page, self.local.run, self.local.start = context
+
+    def pageRecords(self):
+        run = getattr(self.local, "run", None)
+        with self.lock:
+            return [entry for entry in self.records if entry["run"] == run]
+
+    def pageElapsed(self):
+        return time.perf_counter() - getattr(self.local, "start", time.perf_counter())
+
+    # Dump e riepilogo aspettano le metriche ancora in raccolta
+    def dump(self, path):
+        self.pending.join()
+        with self.lock:
+            records = list(self.records)
+        with open(path, "w") as f:
+            json.dump(records, f, indent=2)
+
+    def summary(self):
+        self.pending.join()
+        with self.lock:
+            return riepilogo(pd.DataFrame(list(self.records)))
+
+
+# Riepilogo per metodo: i più costosi in cima, per decidere quali aggregazioni precalcolare
+def riepilogo(df):
+    if df.empty:
+        return df
+    return df.groupby("method").agg(
+        calls=("wall_s", "size"), total_s=("wall_s", "sum"), mean_s=("wall_s", "mean"), max_s=("wall_s", "max"),
+        jobs=("jobs", "sum"), shuffle_read_records=("shuffle_read_records", "sum"),
+        result_bytes=("result_bytes", "sum"), cache_hits=("cache_hit", "sum"), lazy=("lazy", "any"),
+    ).sort_values("total_s", ascending=False)
+
+
+def iniziaPagina(spark, pagina):
+    if spark.profiler is not None:
+        spark.profiler.startPage(pagina)
+
+
+# Pannello nella sidebar con i tempi delle query dell'ultima esecuzione della pagina
+def pannelloTempi(spark):
+    if spark.profiler is None:
+        return
+    import streamlit as st
+
+    records = spark.profiler.pageRecords()
+    with st.sidebar.expander("Query timing", expanded=False):
+        st.metric("Page time (s)", round(spark.profiler.pageElapsed(), 3))
+        if not records:
+            st.caption("No queries recorded for this page")
+            return
+        df = pd.DataFrame(records)[PANEL_COLUMNS].sort_values("wall_s", ascending=False)
+        st.metric("Query time (s)", round(df["wall_s"].sum(), 3))
+        st.dataframe(df, hide_index=True, use_container_width=True)
+        st.caption("lazy = the page computes the returned DataFrame later, outside the measured time. "
+                   "Spark metrics (jobs, stages, ...) appear once collected in the background")
+
+
+if __name__ == "__main__":
+    # Analisi offline del log scritto durante l'uso dell'applicazione
+    log = pd.read_json(sys.argv[1] if len(sys.argv) > 1 else PROFILING_LOG, lines=True)
+    print(riepilogo(log).to_string())
+    print(log.groupby("page")["wall_s"].sum().sort_values(ascending=False).to_string())
@@ -0,0 +1,261 @@
+import functools
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pyspark.sql import DataFrame
+from pyspark.sql.types import StructType
+
+from Transfer import TransferBudgetExceeded, toPandasLimitato
+
+from Utility import (FINGERPRINT_KEYS, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_MAX_DISK_BYTES, RESULT_CACHE_MAX_ENTRIES,
+                     RESULT_CACHE_MAX_ENTRY_BYTES, is_snapshot_valid, write_fingerprint)
+
+META_FILE = "_meta.json"
+
+
+# Versione del dataset: il CSV di origine più il numero di batch aggiunti dallo streaming
+def versioneDataset(fingerprint):
+    return f"{fingerprint['sha256']}-{fingerprint.get('batches', 0)}"
+
+
+# Un risultato viene salvato come lista di tabelle pandas; per i DataFrame Spark si conserva anche lo schema,
+# così alla lettura si ricostruisce un DataFrame identico (ma locale, senza rieseguire la query)
+def _scomponi(value, max_bytes):
+    tuple_result = isinstance(value, tuple)
+    parti = []
+    for item in (value if tuple_result else (value,)):
+        if isinstance(item, DataFrame):
+            try:
+                parti.append(("spark", toPandasLimitato(item, max_bytes=max_bytes), item.schema.json()))
+            except TransferBudgetExceeded:
+                return None
+        elif isinstance(item, pd.DataFrame):
+            parti.append(("pandas", item, None))
+        else:
+            return None
+    return tuple_result, parti
+
+
+def _ricomponi(session, tuple_result, parti):
+    valori = []
+    for tipo, pdf, schema in parti:
+        if tipo == "spark":
+            valori.append(session.createDataFrame(pdf, schema=StructType.fromJson(json.loads(schema))))
+        else:
+            # Le pagine modificano i DataFrame inplace: ogni chiamata riceve una copia
+            valori.append(pdf.copy())
+    return tuple(valori) if tuple_result else valori[0]
+
+
+# Dimensione su disco di una voce (una cartella di file Parquet)
+def _dimensioneVoce(path):
+    try:
+        return sum(voce.stat().st_size for voce in os.scandir(path) if voce.is_file())
+    except OSError:
+        return 0
+
+
+# Cache dei risultati del QueryManager su due livelli: LRU in memoria (limitata per numero e byte) e Parquet
+# su disco dentro lo snapshot, che sopravvive ai riavvii. Su disco ogni versione del dataset ha la sua cartella:
+# alla variazione della versione la memoria viene svuotata e le cartelle delle altre versioni rimosse. Anche il
+# livello su disco ha un limite in byte, oltre il quale si eliminano le voci lette meno di recente
+class ResultCache:
+    def __init__(self, directory, max_bytes=RESULT_CACHE_MAX_BYTES, max_entries=RESULT_CACHE_MAX_ENTRIES,
+                 max_entry_bytes=RESULT_CACHE_MAX_ENTRY_BYTES, max_disk_bytes=RESULT_CACHE_MAX_DISK_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.max_entry_bytes = max_entry_bytes
+        self.max_disk_bytes = max_disk_bytes
+        # Una sola pulizia del disco alla volta
+        self.lockDisco = threading.Lock()
+        self.memoria = OrderedDict()
+        self.byte = 0
+        self.version = None
+        self.lock = threading.RLock()
+        self.hits = {"memory": 0, "disk": 0, "miss": 0}
+        # Gli stessi contatori per il thread corrente: il profiler li usa per sapere se la chiamata che misura
+        # è stata servita dalla cache
+        self.locale = threading.local()
+        # Chiavi in calcolo, con l'evento su cui aspettano le altre richieste della stessa chiave
+        self.inCorso = {}
+        # Con bypass ogni chiamata ricalcola il risultato senza leggere né scrivere la cache (usato dal benchmark)
+        self.bypass = False
+
+    def allinea(self, fingerprint):
+        version = versioneDataset(fingerprint)
+        with self.lock:
+            if version == self.version:
+                return version
+            self.memoria.clear()
+            self.byte = 0
+            cartella = os.path.join(self.directory, version)
+            if not is_snapshot_valid(cartella, fingerprint, FINGERPRINT_KEYS + ("batches",)):
+                shutil.rmtree(cartella, ignore_errors=True)
+                os.makedirs(cartella)
+                write_fingerprint(cartella, fingerprint)
+            # Le altre versioni (e le scritture temporanee rimaste a metà) non verranno più lette
+            for voce in os.scandir(self.directory):
+                if voce.name == version:
+                    continue
+                if voce.is_dir():
+                    shutil.rmtree(voce.path, ignore_errors=True)
+                else:
+                    os.remove(voce.path)
+            self.version = version
+            return version
+
+    def chiave(self, version, name, args, kwargs):
+        argomenti = [repr(arg) for arg in args], sorted((k, repr(v)) for k, v in kwargs.items())
+        testo = json.dumps([version, name, *argomenti])
+        return hashlib.sha256(testo.encode()).hexdigest()
+
+    def get(self, session, fingerprint, name, args, kwargs, compute):
+        if self.bypass:
+            return compute()
+        version = self.allinea(fingerprint)
+        key = self.chiave(version, name, args, kwargs)
+        entry = self.attendi(key)
+        if entry is not None:
+            return _ricomponi(session, *entry)
+
+        path = os.path.join(self.directory, version, key)
+        try:
+            entry = self.leggiDisco(path)
+            if entry is not None:
+                self.conta("disk")
+                self.inserisci(key, entry)
+                return _ricomponi(session, *entry)
+
+            self.conta("miss")
+            value = compute()
+            entry = _scomponi(value, self.max_entry_bytes)
+            # Risultati non tabellari (Row, liste, ...) o troppo grandi non vengono messi in cache
+            if entry is None:
+                return value
+            if self.inserisci(key, entry) and self.scriviDisco(path, entry):
+                self.liberaDisco(path)
+            return _ricomponi(session, *entry)
+        finally:
+            with self.lock:
+                self.inCorso.pop(key).set()
+
+    # Voce in memoria della chiave, oppure None se tocca al thread chiamante calcolarla. Se un altro thread la sta
+    # già calcolando si aspetta che finisca: richieste concorrenti della stessa chiave eseguono la query una volta.
+    # Un risultato che non entra in cache viene ricalcolato da chi aspettava, uno alla volta
+    def attendi(self, key):
+        while True:
+            with self.lock:
+                cached = self.memoria.get(key)
+                if cached is not None:
+                    self.memoria.move_to_end(key)
+                    self.conta("memory")
+                    return cached[0]
+                evento = self.inCorso.get(key)
+                if evento is None:
+                    self.inCorso[key] = threading.Event()
+                    return None
+            evento.wait()
+
+    def inserisci(self, key, entry):
+        size = int(sum(pdf.memory_usage(deep=True).sum() for _, pdf, _ in entry[1]))
+        if size > self.max_entry_bytes:
+            return False
+        with self.lock:
+            if key in self.memoria:
+                self.byte -= self.memoria.pop(key)[1]
+            self.memoria[key] = (entry, size)
+            self.byte += size
+            while self.memoria and (self.byte > self.max_bytes or len(self.memoria) > self.max_entries):
+                _, (_, evicted) = self.memoria.popitem(last=False)
+                self.byte -= evicted
+        return True
+
+    def leggiDisco(self, path):
+        try:
+            with open(os.path.join(path, META_FILE)) as f:
+                meta = json.load(f)
+            parti = [(tipo, pq.read_table(os.path.join(path, f"{i}.parquet")).to_pandas(), schema)
+                     for i, (tipo, schema) in enumerate(meta["parts"])]
+        except (OSError, ValueError, KeyError, pa.ArrowException):
+            return None
+        # La data di modifica della cartella segna l'ultimo uso della voce, per la pulizia del disco
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return meta["tuple"], parti
+
+    # Scrittura in una cartella temporanea e rinomina: un risultato su disco è sempre completo. Se nel frattempo
+    # la versione è cambiata la cartella di destinazione non esiste più e il risultato non viene salvato
+    def scriviDisco(self, path, entry):
+        tuple_result, parti = entry
+        tmp = os.path.join(self.directory, f"_tmp_{uuid.uuid4().hex}")
+        try:
+            os.makedirs(tmp)
+            for i, (_, pdf, _) in enumerate(parti):
+                pq.write_table(pa.Table.from_pandas(pdf), os.path.join(tmp, f"{i}.parquet"))
+            with open(os.path.join(tmp, META_FILE), "w") as f:
+                json.dump({"tuple": tuple_result, "parts": [[tipo, schema] for tipo, _, schema in parti]}, f)
+            os.replace(tmp, path)
+            return True
+        except (OSError, pa.ArrowException) as e:
+            print(f"Risultato non salvato su disco: {e}")
+            return False
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    # Oltre il limite in byte si eliminano le voci della versione usate meno di recente, tranne quella appena scritta
+    def liberaDisco(self, scritta):
+        with self.lockDisco:
+            try:
+                voci = [(voce.stat().st_mtime, voce.path) for voce in os.scandir(os.path.dirname(scritta))
+                        if voce.is_dir() and voce.path != scritta]
+            except OSError:
+                return
+            voci = [(mtime, path, _dimensioneVoce(path)) for mtime, path in voci]
+            totale = _dimensioneVoce(scritta) + sum(size for _, _, size in voci)
+            for _, path, size in sorted(voci):
+                if totale <= self.max_disk_bytes:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                totale -= size
+
+    def clear(self):
+        with self.lock:
+            self.memoria.clear()
+            self.byte = 0
+            self.version = None
+
+    def conta(self, tipo):
+        with self.lock:
+            self.hits[tipo] += 1
+        if not hasattr(self.locale, "hits"):
+            self.locale.hits = dict.fromkeys(self.hits, 0)
+        self.locale.hits[tipo] += 1
+
+    def threadHits(self):
+        return dict(getattr(self.locale, "hits", dict.fromkeys(self.hits, 0)))
+
+    def stats(self):
+        with self.lock:
+            return dict(self.hits, entries=len(self.memoria), bytes=self.byte, version=self.version)
+
+
+# Decoratore per i metodi del QueryManager che restituiscono tabelle (DataFrame Spark o pandas, anche in tupla)
+def risultatoInCache(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        # Risultati esatti e approssimati non condividono le voci
+        name = f"{method.__name__}~approx" if getattr(self, "approssimato", False) else method.__name__
+        return self.getResultCache().get(self.spark.spark, self.spark.fingerprint, name, args, kwargs,
+                                         lambda: method(self, *args, **kwargs))
+    return wrapper
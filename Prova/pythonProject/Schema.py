@@ -0,0 +1,54 @@
+from pyspark.sql.functions import col
+from pyspark.sql.types import StructType, StructField, StringType, IntegerType, FloatType, DateType
+
+# Schema di Hotel_Reviews.csv, con le colonne nello stesso ordine del file.
+# days_since_review ("0 days") e lat/lng ("NA" quando mancano) restano stringhe:
+# vengono convertiti in castDataset come prima, senza far risultare malformate quelle righe
+SCHEMA_RECENSIONI = StructType([
+    StructField("Hotel_Address", StringType()),
+    StructField("Additional_Number_of_Scoring", IntegerType()),
+    StructField("Review_Date", DateType()),
+    StructField("Average_Score", FloatType()),
+    StructField("Hotel_Name", StringType()),
+    StructField("Reviewer_Nationality", StringType()),
+    StructField("Negative_Review", StringType()),
+    StructField("Review_Total_Negative_Word_Counts", IntegerType()),
+    StructField("Total_Number_of_Reviews", IntegerType()),
+    StructField("Positive_Review", StringType()),
+    StructField("Review_Total_Positive_Word_Counts", IntegerType()),
+    StructField("Total_Number_of_Reviews_Reviewer_Has_Given", IntegerType()),
+    StructField("Reviewer_Score", FloatType()),
+    StructField("Tags", StringType()),
+    StructField("days_since_review", StringType()),
+    StructField("lat", StringType()),
+    StructField("lng", StringType()),
+])
+
+CORRUPT_COLUMN = "_corrupt_record"
+
+OPZIONI_CSV = {"header": True, "dateFormat": "M/d/yyyy", "mode": "PERMISSIVE"}
+
+
+def schemaRecensioni(validate=False):
+    if not validate:
+        return SCHEMA_RECENSIONI
+    # In modalità validazione Spark salva la riga originale nella colonna dei record corrotti
+    return StructType(SCHEMA_RECENSIONI.fields + [StructField(CORRUPT_COLUMN, StringType())])
+
+
+def leggiRecensioni(spark, path, validate=False):
+    reader = spark.read.options(**OPZIONI_CSV).schema(schemaRecensioni(validate))
+    if validate:
+        reader = reader.option("columnNameOfCorruptRecord", CORRUPT_COLUMN)
+    return reader.csv(path)
+
+
+# Stampa le righe malformate senza interrompere il caricamento e ne restituisce il numero.
+# Spark non permette di filtrare sulla sola colonna dei record corrotti: df deve essere già in cache
+def riportaRigheMalformate(df, limit=20):
+    malformate = df.filter(col(CORRUPT_COLUMN).isNotNull())
+    totale = malformate.count()
+    if totale > 0:
+        print(f"Trovate {totale} righe malformate in Hotel_Reviews.csv")
+        malformate.select(CORRUPT_COLUMN).show(limit, truncate=False)
+    return totale
@@ -0,0 +1,124 @@
+import os
+import string
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pyspark.sql.functions import col, concat, count, explode, lit, lower, regexp_replace, split, when
+
+from Utility import (REVIEW_ID, SEARCH_BM25_K1, SEARCH_BM25_B, SEARCH_LIMIT, SEARCH_ROW_GROUP_BYTES,
+                     SEARCH_ROW_GROUP_ROWS, get_stop_words)
+
+POSTINGS_DIR = "postings"
+DOCUMENTS_DIR = "documents"
+# Metadati di ogni recensione usati dai filtri e dalla normalizzazione per lunghezza di BM25
+DOCUMENT_COLUMNS = [REVIEW_ID, "Hotel_Name", "City_Hotel", "Review_Date"]
+RESULT_COLUMNS = [REVIEW_ID, "Hotel_Name", "City_Hotel", "Review_Date", "Score", "Positive_Review", "Negative_Review"]
+
+
+# Termini come in topWordsFrequency: minuscolo, punteggiatura ai bordi rimossa, senza stopwords e numeri
+def tokenizza(testi):
+    words = testi.str.lower().str.split(r"\s+", regex=True).explode().dropna().str.strip(string.punctuation)
+    return words[words.str.contains(r"[^\W\d_]", regex=True) & ~words.isin(get_stop_words())]
+
+
+# Testo indicizzato di una recensione: i segnaposto "No Negative" / "No Positive" non sono contenuto
+def testoIndicizzato():
+    negative = when(col("Negative_Review") != "No Negative", col("Negative_Review")).otherwise("")
+    positive = when(col("Positive_Review") != "No Positive", col("Positive_Review")).otherwise("")
+    return lower(concat(negative, lit(" "), positive))
+
+
+# Postings (term, Review_Id, tf) e documenti (metadati e lunghezza) dal dataset completo o da un batch.
+# I postings sono ordinati per termine: le statistiche dei row group escludono i blocchi senza il termine
+def calcolaIndiceRicerca(dataset, path, mode="overwrite"):
+    stop_words = sorted(get_stop_words())
+    termini = dataset.select(REVIEW_ID, explode(split(testoIndicizzato(), r"\s+")).alias("term"))
+    termini = termini.select(REVIEW_ID, regexp_replace(col("term"), r"^\p{Punct}+|\p{Punct}+$", "").alias("term"))
+    termini = termini.filter(col("term").rlike(r"\p{L}") & ~col("term").isin(stop_words))
+    postings = termini.groupBy("term", REVIEW_ID).agg(count("*").cast("int").alias("tf")).cache()
+
+    lunghezze = postings.groupBy(REVIEW_ID).agg({"tf": "sum"}).withColumnRenamed("sum(tf)", "Length")
+    documenti = dataset.select(*DOCUMENT_COLUMNS).join(lunghezze, REVIEW_ID, "left").fillna(0, ["Length"])
+
+    postings.repartitionByRange("term").sortWithinPartitions("term").write.mode(mode) \
+        .option("parquet.block.size", SEARCH_ROW_GROUP_BYTES).parquet(os.path.join(path, POSTINGS_DIR))
+    documenti.write.mode(mode).parquet(os.path.join(path, DOCUMENTS_DIR))
+    postings.unpersist()
+
+
+# Stessa struttura costruita in pandas, per il motore senza Spark
+def calcolaIndiceRicercaLocale(dataset, path):
+    negative = dataset["Negative_Review"].where(dataset["Negative_Review"] != "No Negative", "").fillna("")
+    positive = dataset["Positive_Review"].where(dataset["Positive_Review"] != "No Positive", "").fillna("")
+    dataset = dataset.reset_index(drop=True)
+    termini = tokenizza((negative + " " + positive).reset_index(drop=True))
+    postings = pd.DataFrame({"term": termini.to_numpy(), REVIEW_ID: dataset[REVIEW_ID].to_numpy()[termini.index]})
+    postings = postings.groupby(["term", REVIEW_ID]).size().astype("int32").rename("tf").reset_index()
+
+    documenti = dataset[DOCUMENT_COLUMNS].copy()
+    documenti["Length"] = documenti[REVIEW_ID].map(postings.groupby(REVIEW_ID)["tf"].sum()).fillna(0).astype("int64")
+
+    for nome, tabella in ((POSTINGS_DIR, postings), (DOCUMENTS_DIR, documenti)):
+        os.makedirs(os.path.join(path, nome), exist_ok=True)
+        pq.write_table(pa.Table.from_pandas(tabella, preserve_index=False),
+                       os.path.join(path, nome, "part-00000.parquet"), row_group_size=SEARCH_ROW_GROUP_ROWS)
+
+
+# Ricerca sull'indice salvato, senza Spark: i documenti (poche colonne) restano in memoria, dei postings
+# si leggono solo i row group dei termini cercati e dei testi solo le righe dei risultati
+class ReviewSearchIndex:
+    def __init__(self, path, snapshot, k1=SEARCH_BM25_K1, b=SEARCH_BM25_B):
+        self.path = path
+        self.snapshot = snapshot
+        self.k1 = k1
+        self.b = b
+        documenti = pq.read_table(os.path.join(path, DOCUMENTS_DIR)).to_pandas(date_as_object=False)
+        self.documenti = documenti.set_index(REVIEW_ID)
+        self.N = len(documenti)
+        self.avgdl = float(documenti["Length"].mean()) if self.N else 0.0
+
+    def postings(self, termini):
+        return pq.read_table(os.path.join(self.path, POSTINGS_DIR), filters=[("term", "in", termini)]).to_pandas()
+
+    def texts(self, ids):
+        tabella = pq.read_table(self.snapshot, columns=[REVIEW_ID, "Positive_Review", "Negative_Review"],
+                                filters=[(REVIEW_ID, "in", ids)])
+        return tabella.to_pandas()
+
+    # Le recensioni più pertinenti per il testo cercato (BM25), filtrate per hotel, città e intervallo di date
+    def search(self, text, hotel=None, city=None, date_from=None, date_to=None, limit=SEARCH_LIMIT):
+        termini = sorted(set(tokenizza(pd.Series([text]))))
+        if not termini or not self.N:
+            return pd.DataFrame(columns=RESULT_COLUMNS)
+        postings = self.postings(termini)
+
+        # La frequenza nei documenti (e quindi l'IDF) si calcola sull'intero corpus, prima dei filtri
+        df = postings.groupby("term").size()
+        idf = np.log((self.N - df + 0.5) / (df + 0.5) + 1)
+
+        candidati = self.documenti.loc[self.documenti.index.intersection(postings[REVIEW_ID].unique())]
+        if hotel is not None:
+            candidati = candidati[candidati["Hotel_Name"] == hotel]
+        if city is not None:
+            candidati = candidati[candidati["City_Hotel"] == city]
+        if date_from is not None:
+            candidati = candidati[candidati["Review_Date"] >= pd.Timestamp(date_from)]
+        if date_to is not None:
+            candidati = candidati[candidati["Review_Date"] <= pd.Timestamp(date_to)]
+        postings = postings[postings[REVIEW_ID].isin(candidati.index)]
+        if postings.empty:
+            return pd.DataFrame(columns=RESULT_COLUMNS)
+
+        tf = postings["tf"].to_numpy(dtype=np.float64)
+        dl = candidati["Length"].reindex(postings[REVIEW_ID]).to_numpy(dtype=np.float64)
+        norma = self.k1 * (1 - self.b + self.b * dl / self.avgdl)
+        postings = postings.assign(Score=postings["term"].map(idf).to_numpy() * tf * (self.k1 + 1) / (tf + norma))
+        # Ordinamento stabile sugli id già ordinati: a parità di punteggio vince il Review_Id minore
+        punteggi = postings.groupby(REVIEW_ID)["Score"].sum().sort_values(ascending=False, kind="stable").head(limit)
+
+        risultati = candidati.loc[punteggi.index, DOCUMENT_COLUMNS[1:]].assign(Score=punteggi)
+        risultati = risultati.rename_axis(REVIEW_ID).reset_index()
+        testi = self.texts([int(i) for i in punteggi.index])
+        return risultati.merge(testi, on=REVIEW_ID, how="left")[RESULT_COLUMNS]
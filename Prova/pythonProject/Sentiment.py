@@ -0,0 +1,107 @@
+import os
+
+from pyspark.ml import Pipeline, PipelineModel
+from pyspark.ml.classification import LogisticRegression
+from pyspark.ml.evaluation import BinaryClassificationEvaluator
+from pyspark.ml.feature import Tokenizer, StopWordsRemover, HashingTF, IDF
+from pyspark.ml.functions import vector_to_array
+from pyspark.sql.functions import array_max, coalesce, col, lit, when
+
+from Utility import PATH_MODELS
+
+# Colonne aggiunte dalla pipeline: vengono rimosse dopo aver letto sentiment e confidenza
+PIPELINE_COLUMNS = ["Review", "Tokens", "Words", "TF", "features", "rawPrediction", "probability", "prediction"]
+
+
+# Un modello per ogni versione del dataset: il nome contiene l'hash del file sorgente
+def sparkModelPath(fingerprint, directory=PATH_MODELS):
+    return os.path.join(directory, f"sentiment_spark_{fingerprint['sha256'][:16]}")
+
+
+# Pipeline Spark ML: tokenizzazione, stopwords, TF-IDF con hashing e classificatore, tutto sugli executor.
+# Il testo grezzo entra sempre dalla colonna Review: la stessa trasformazione vale in addestramento,
+# nella classificazione in batch e in quella di una singola recensione
+def buildSentimentPipeline(num_features=1 << 18):
+    tokenizer = Tokenizer(inputCol="Review", outputCol="Tokens")
+    remover = StopWordsRemover(inputCol="Tokens", outputCol="Words")
+    hashing = HashingTF(inputCol="Words", outputCol="TF", numFeatures=num_features)
+    idf = IDF(inputCol="TF", outputCol="features")
+    classifier = LogisticRegression(featuresCol="features", labelCol="Sentiment", maxIter=20)
+    return Pipeline(stages=[tokenizer, remover, hashing, idf, classifier])
+
+
+def trainSparkModel(spark, directory=PATH_MODELS):
+    dataset = spark.query.getClassificationDataFrame()
+    train, test = dataset.randomSplit([0.5, 0.5], seed=42)
+
+    model = buildSentimentPipeline().fit(train)
+
+    predictions = model.transform(test).cache()
+    accuracy = predictions.filter(col("prediction") == col("Sentiment")).count() / predictions.count()
+    auc = BinaryClassificationEvaluator(labelCol="Sentiment").evaluate(predictions)
+    print("Accuracy:", accuracy)
+    print("Area under ROC:", auc)
+    predictions.unpersist()
+
+    path = sparkModelPath(spark.fingerprint, directory)
+    model.write().overwrite().save(path)
+    return path
+
+
+def loadSparkModel(fingerprint, directory=PATH_MODELS):
+    path = sparkModelPath(fingerprint, directory)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Nessun modello per questa versione del dataset: eseguire Sentiment.py ({path})")
+    return PipelineModel.load(path)
+
+
+# Classe predetta e probabilità della classe scelta, dalle colonne aggiunte dal classificatore
+def sentimentColumn():
+    return col("prediction").cast("int")
+
+
+def confidenceColumn():
+    return array_max(vector_to_array(col("probability")))
+
+
+# Punteggio in batch: df deve avere una colonna Review
+def scoreReviews(model, df):
+    return model.transform(df).select("Review", sentimentColumn().alias("Sentiment"),
+                                      confidenceColumn().alias("Confidence"))
+
+
+# Punteggio di più recensioni con un solo job, nell'ordine ricevuto: (classe, probabilità) per ciascuna
+def predictReviews(model, session, reviews):
+    df = session.createDataFrame([(review,) for review in reviews], "Review string")
+    return [(row["Sentiment"], row["Confidence"]) for row in scoreReviews(model, df).collect()]
+
+
+# Punteggio di una singola recensione: restituisce la classe predetta e la sua probabilità
+def predictReview(model, session, review):
+    return predictReviews(model, session, [review])[0]
+
+
+# Aggiunge accanto alle recensioni il sentiment predetto e la confidenza; i segnaposto restano null
+def scoreDataset(df, model):
+    for review, placeholder in (("Positive", "No Positive"), ("Negative", "No Negative")):
+        testo = col(f"{review}_Review")
+        valida = testo.isNotNull() & (testo != placeholder)
+        # Il Tokenizer non accetta valori null: i testi mancanti diventano vuoti e il risultato viene scartato
+        df = model.transform(df.withColumn("Review", coalesce(testo, lit(""))))
+        df = df.withColumn(f"{review}_Sentiment", when(valida, sentimentColumn())) \
+            .withColumn(f"{review}_Confidence", when(valida, confidenceColumn())) \
+            .drop(*PIPELINE_COLUMNS)
+    return df
+
+
+if __name__ == "__main__":
+    import sys
+    from Backend import SparkBuilder
+
+    spark = SparkBuilder("sentimentTraining")
+    # "score" classifica tutto il corpus con il modello già salvato, altrimenti la pipeline viene addestrata
+    if len(sys.argv) > 1 and sys.argv[1] == "score":
+        print("Recensioni classificate:", spark.query.getScoredDataset(build=True).count())
+    else:
+        print("Modello salvato in", trainSparkModel(spark))
+    spark.closeConnection()
@@ -0,0 +1,176 @@
+import asyncio
+import json
+import time
+from collections import deque
+
+import numpy as np
+from pyspark.sql import SparkSession
+
+from Sentiment import loadSparkModel, predictReviews
+from Utility import PATH_SNAPSHOT, SERVICE_HOST, SERVICE_PORT, read_fingerprint
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           500: "Internal Server Error"}
+
+
+# Servizio di classificazione sempre in memoria: la pipeline Spark ML (la stessa della classificazione in batch)
+# viene caricata una volta, le richieste concorrenti vengono raccolte in piccoli batch e classificate con un job solo
+class SentimentService:
+    def __init__(self, model, session, max_batch=64, max_wait=0.005, window=10000):
+        self.model = model
+        self.session = session
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.latencies = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.requests = 0
+        self.queue = None
+
+    def score(self, reviews):
+        sentiments, confidences = zip(*predictReviews(self.model, self.session, reviews))
+        return sentiments, confidences
+
+    async def predict(self, review):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((review, future))
+        return await future
+
+    # Raccoglie le richieste in attesa fino a max_batch o per al massimo max_wait secondi
+    async def batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            reviews = [review for review, _ in batch]
+            try:
+                # Il modello gira in un thread, così il loop continua ad accettare richieste
+                sentiments, confidences = await loop.run_in_executor(None, self.score, reviews)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batch_sizes.append(len(batch))
+            for (_, future), sentiment, confidence in zip(batch, sentiments, confidences):
+                if not future.done():
+                    future.set_result((int(sentiment), float(confidence)))
+
+    def stats(self):
+        latencies = np.array(self.latencies) * 1000 if self.latencies else np.zeros(1)
+        return {
+            "requests": self.requests,
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "avg_batch_size": float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0,
+        }
+
+    async def route(self, method, path, body):
+        if path == "/health":
+            return 200, {"status": "ok"}
+        if path == "/stats":
+            return 200, self.stats()
+        if path != "/predict":
+            return 404, {"error": "not found"}
+        if method != "POST":
+            return 405, {"error": "use POST"}
+
+        try:
+            data = json.loads(body or b"{}")
+        except ValueError:
+            return 400, {"error": "invalid JSON"}
+        # Accetta una recensione ("review") oppure una lista ("reviews")
+        if not isinstance(data, dict):
+            return 400, {"error": "expected a JSON object"}
+        reviews = data.get("reviews", [data["review"]] if "review" in data else None)
+        if not isinstance(reviews, list) or not reviews or not all(isinstance(review, str) for review in reviews):
+            return 400, {"error": "expected 'review' or 'reviews'"}
+
+        try:
+            results = await asyncio.gather(*(self.predict(review) for review in reviews))
+        except Exception as e:
+            return 500, {"error": f"prediction failed: {e}"}
+        return 200, {"predictions": [
+            {"sentiment": "Positive" if sentiment == 1 else "Negative", "confidence": confidence}
+            for sentiment, confidence in results
+        ]}
+
+    async def respond(self, writer, status, payload):
+        content = json.dumps(payload).encode()
+        writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                     f"Content-Type: application/json\r\n"
+                     f"Content-Length: {len(content)}\r\n\r\n".encode() + content)
+        await writer.drain()
+
+    # HTTP/1.1 minimale con keep-alive: una connessione può inviare più richieste di seguito
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                start = time.perf_counter()
+                try:
+                    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                except ValueError:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    # Senza una lunghezza valida il corpo non si può separare dalla richiesta successiva
+                    await self.respond(writer, 400, {"error": "invalid Content-Length"})
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, payload = await self.route(method, path, body)
+                await self.respond(writer, status, payload)
+
+                if path == "/predict":
+                    self.requests += 1
+                    self.latencies.append(time.perf_counter() - start)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=SERVICE_HOST, port=SERVICE_PORT):
+        self.queue = asyncio.Queue()
+        batcher = asyncio.create_task(self.batcher())
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Servizio di sentiment in ascolto su http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+
+if __name__ == "__main__":
+    fingerprint = read_fingerprint(PATH_SNAPSHOT)
+    if fingerprint is None:
+        raise SystemExit("Snapshot del dataset non trovato: avviare prima l'applicazione o Sentiment.py")
+    session = SparkSession.builder.master("local[*]").appName("sentimentService").getOrCreate()
+    service = SentimentService(loadSparkModel(fingerprint), session)
+    # Il primo job compila il piano della pipeline: lo si esegue prima di accettare richieste
+    service.score(["warm up"])
+    asyncio.run(service.serve())
@@ -0,0 +1,17 @@
+import os
+import sys
+import threading
+
+from streamlit.web import bootstrap
+
+from Backend import getSparkBuilder
+
+HOMEPAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Homepage.py")
+
+# Avvio dell'applicazione: 'python Server.py [argomenti di streamlit]' al posto di 'streamlit run Homepage.py'.
+# Con 'streamlit run' il riscaldamento parte solo quando la prima sessione esegue Homepage.py; qui parte in un
+# thread del processo del server, appena avviato. Le pagine importano lo stesso modulo Backend e trovano il
+# SparkBuilder nel registro (o ne attendono la costruzione sul lock del registro)
+if __name__ == "__main__":
+    threading.Thread(target=getSparkBuilder, name="warm-up", daemon=True).start()
+    bootstrap.run(HOMEPAGE, False, sys.argv[1:], {})
@@ -0,0 +1,155 @@
+import os
+import pickle
+import string
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from Utility import HLL_PRECISION, SKETCH_TOP_K, SKETCH_Z, get_stop_words
+
+SKETCH_FILE = "sketches.joblib"
+
+
+# HyperLogLog su hash a 64 bit: 2^p registri, errore relativo standard 1.04 / sqrt(2^p).
+# Due sketch si uniscono con il massimo registro per registro, quindi si possono aggiornare a batch
+class HyperLogLog:
+    def __init__(self, p=HLL_PRECISION):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def add(self, values):
+        values = pd.Series(values).dropna()
+        if values.empty:
+            return self
+        hashes = pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+        indici = hashes >> np.uint64(64 - self.p)
+        resto = hashes << np.uint64(self.p)
+        # Posizione del primo bit a 1 nei 64 - p bit rimasti (64 - p + 1 se sono tutti zero)
+        rho = np.full(len(resto), 64 - self.p + 1, dtype=np.uint8)
+        nonzero = resto != 0
+        rho[nonzero] = 64 - np.floor(np.log2(resto[nonzero].astype(np.float64))).astype(np.uint8)
+        np.maximum.at(self.registers, indici.astype(np.int64), np.minimum(rho, 64 - self.p + 1))
+        return self
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeri = int(np.count_nonzero(self.registers == 0))
+        # Correzione per cardinalità piccole: conteggio lineare dei registri vuoti
+        if raw <= 2.5 * m and zeri > 0:
+            return m * np.log(m / zeri)
+        return raw
+
+    def relativeError(self):
+        return 1.04 / np.sqrt(len(self.registers))
+
+    # Stima e semiampiezza dell'intervallo (SKETCH_Z errori standard)
+    def result(self):
+        stima = self.estimate()
+        return int(round(stima)), int(np.ceil(SKETCH_Z * self.relativeError() * stima))
+
+
+# Riassunto dei k elementi più frequenti, unibile tra partizioni e batch (mergeable summaries):
+# per ogni elemento tenuto vale count <= vero <= count + error, ogni elemento scartato ha al più "soglia" occorrenze
+class TopK:
+    def __init__(self, k=SKETCH_TOP_K):
+        self.k = k
+        self.counts = pd.Series(dtype="int64")
+        self.errors = pd.Series(dtype="int64")
+        self.soglia = 0
+
+    def addCounts(self, counts):
+        parziale = TopK(self.k)
+        parziale.counts = counts.astype("int64")
+        parziale.errors = pd.Series(0, index=counts.index, dtype="int64")
+        return self.merge(parziale._tronca())
+
+    def merge(self, other):
+        indice = self.counts.index.union(other.counts.index)
+        counts = self.counts.reindex(indice, fill_value=0) + other.counts.reindex(indice, fill_value=0)
+        # Un elemento assente da un riassunto può averne avute al più la sua soglia
+        errors = self.errors.reindex(indice).fillna(self.soglia) + other.errors.reindex(indice).fillna(other.soglia)
+        self.counts, self.errors = counts.astype("int64"), errors.astype("int64")
+        self.soglia += other.soglia
+        return self._tronca()
+
+    def _tronca(self):
+        if len(self.counts) > self.k:
+            ordine = self.counts.sort_values(ascending=False, kind="stable").index
+            tenuti, scartati = ordine[:self.k], ordine[self.k:]
+            massimo = (self.counts[scartati] + self.errors[scartati]).max()
+            self.soglia = int(max(self.soglia, massimo))
+            self.counts, self.errors = self.counts[tenuti], self.errors[tenuti]
+        return self
+
+    def top(self, n, item="word", count="count"):
+        df = pd.DataFrame({item: self.counts.index, count: self.counts.to_numpy(),
+                           f"{count}_Error": self.errors.to_numpy()})
+        return df.sort_values([count, item], ascending=[False, True]).head(n).reset_index(drop=True)
+
+
+# Parole come nell'indice delle parole, già ripulite come in topWordsFrequency
+def paroleRipulite(chunk):
+    testo = (chunk["Negative_Review"] + " " + chunk["Positive_Review"]).str.lower()
+    words = testo.str.split(r"\s+", regex=True).explode().dropna().str.strip(string.punctuation)
+    return words[words.str.contains(r"[^\W\d_]", regex=True) & ~words.isin(get_stop_words())]
+
+
+class DatasetSketches:
+    def __init__(self):
+        self.hotelPerCitta = {}
+        self.nazionalitaPerCitta = {}
+        self.parole = TopK()
+        self.tag = TopK()
+
+    def add(self, chunk):
+        for city, gruppo in chunk.groupby("City_Hotel"):
+            self.hotelPerCitta.setdefault(city, HyperLogLog()).add(gruppo["Hotel_Name"])
+            self.nazionalitaPerCitta.setdefault(city, HyperLogLog()).add(gruppo["Reviewer_Nationality"])
+        self.parole.addCounts(paroleRipulite(chunk).value_counts())
+        self.tag.addCounts(chunk["Tags"].explode().dropna().value_counts())
+        return self
+
+    def merge(self, other):
+        for mine, theirs in ((self.hotelPerCitta, other.hotelPerCitta),
+                             (self.nazionalitaPerCitta, other.nazionalitaPerCitta)):
+            for city, hll in theirs.items():
+                if city in mine:
+                    mine[city].merge(hll)
+                else:
+                    mine[city] = hll
+        self.parole.merge(other.parole)
+        self.tag.merge(other.tag)
+        return self
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        joblib.dump(self, os.path.join(directory, SKETCH_FILE))
+
+    @staticmethod
+    def load(directory):
+        return joblib.load(os.path.join(directory, SKETCH_FILE))
+
+
+# Un solo passaggio sul dataset senza shuffle: ogni partizione costruisce i propri sketch
+# e il driver riceve soltanto uno sketch serializzato per partizione, che poi unisce
+def calcolaSketch(dataset):
+    colonne = ["City_Hotel", "Hotel_Name", "Reviewer_Nationality", "Negative_Review", "Positive_Review", "Tags"]
+
+    def sketchPartizione(batches):
+        sketch = DatasetSketches()
+        for chunk in batches:
+            sketch.add(chunk)
+        yield pd.DataFrame({"payload": [pickle.dumps(sketch)]})
+
+    parziali = dataset.select(*colonne).mapInPandas(sketchPartizione, "payload binary").collect()
+    sketch = DatasetSketches()
+    for row in parziali:
+        sketch.merge(pickle.loads(row["payload"]))
+    return sketch
@@ -0,0 +1,64 @@
+import pandas as pd
+from pyspark.sql.functions import col, count, first, round
+
+from Utility import TRANSFER_MAX_ROWS, TRANSFER_MAX_BYTES, TRANSFER_CHUNK_ROWS, MAP_MAX_POINTS
+
+
+class TransferBudgetExceeded(RuntimeError):
+    pass
+
+
+def _byte(pdf):
+    return int(pdf.memory_usage(deep=True).sum())
+
+
+# toPandas (via Arrow) con un limite di righe e di byte per chiamata: al driver arrivano al massimo max_rows + 1 righe
+def toPandasLimitato(df, max_rows=TRANSFER_MAX_ROWS, max_bytes=TRANSFER_MAX_BYTES):
+    pdf = df.limit(max_rows + 1).toPandas()
+    if len(pdf) > max_rows:
+        raise TransferBudgetExceeded(f"Il risultato supera il limite di {max_rows} righe")
+    if _byte(pdf) > max_bytes:
+        raise TransferBudgetExceeded(f"Il risultato supera il limite di {max_bytes} byte")
+    return pdf
+
+
+# Restituisce il risultato a blocchi di chunk_rows righe, una partizione alla volta: il driver non tiene mai
+# l'intero risultato in memoria a meno che sia il chiamante a concatenarlo. Il budget vale sul totale trasferito
+def iterChunks(df, chunk_rows=TRANSFER_CHUNK_ROWS, max_rows=None, max_bytes=TRANSFER_MAX_BYTES):
+    columns = df.columns
+    righe, totale_righe, totale_byte = [], 0, 0
+
+    def blocco():
+        nonlocal totale_righe, totale_byte
+        chunk = pd.DataFrame.from_records(righe, columns=columns)
+        totale_righe += len(chunk)
+        totale_byte += _byte(chunk)
+        if max_rows is not None and totale_righe > max_rows:
+            raise TransferBudgetExceeded(f"Il risultato supera il limite di {max_rows} righe")
+        if totale_byte > max_bytes:
+            raise TransferBudgetExceeded(f"Il risultato supera il limite di {max_bytes} byte")
+        righe.clear()
+        return chunk
+
+    for row in df.toLocalIterator(prefetchPartitions=True):
+        righe.append(row)
+        if len(righe) == chunk_rows:
+            yield blocco()
+    if righe:
+        yield blocco()
+
+
+# Punti per le mappe: se sono più di max_points vengono raggruppati in una griglia sempre più grossolana
+# (coordinate arrotondate), con il numero di punti di ogni cella e i valori delle altre colonne del primo punto
+def perMappa(df, lat="lat", lng="lng", max_points=MAP_MAX_POINTS):
+    if df.limit(max_points + 1).count() <= max_points:
+        return toPandasLimitato(df, max_points)
+    altre = [first(c).alias(c) for c in df.columns if c not in (lat, lng)]
+    for decimali in (3, 2, 1, 0):
+        griglia = df.groupBy(round(col(lat), decimali).alias(lat), round(col(lng), decimali).alias(lng)) \
+            .agg(*altre, count("*").alias("Points"))
+        if griglia.limit(max_points + 1).count() <= max_points:
+            break
+    else:
+        griglia = griglia.orderBy(col("Points").desc()).limit(max_points)
+    return toPandasLimitato(griglia.select(*df.columns, "Points"), max_points)
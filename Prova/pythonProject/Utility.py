@@ -1,9 +1,102 @@
-import string
+import hashlib
+import json
 import math
+import os
+import string
+from functools import lru_cache
+
+import numpy as np
 from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
 
 PATH_DS = "C:\\Users\\ste\\Desktop\\Hotel_Reviews.csv"
+# Snapshot Parquet del dataset già pulito, partizionato per nazione e anno
+PATH_SNAPSHOT = "C:\\Users\\ste\\Desktop\\Hotel_Reviews_snapshot"
+SNAPSHOT_PARTITIONS = ["Country_Hotel", "Review_Year"]
+FINGERPRINT_FILE = "_fingerprint.json"
+# Indice delle frequenze delle parole, salvato accanto allo snapshot (Spark ignora le cartelle che iniziano con _)
+WORD_INDEX_DIR = "_word_index"
+# Cartella in cui arrivano le nuove esportazioni giornaliere delle recensioni
+PATH_DROP = "C:\\Users\\ste\\Desktop\\Hotel_Reviews_drop"
+# Il checkpoint dello streaming vive nello snapshot: se lo snapshot viene ricostruito, i file vengono rielaborati
+CHECKPOINT_DIR = "_checkpoint"
+# Cartella di appoggio in cui viene scritto un batch prima di spostarne i file nello snapshot
+STAGING_DIR = "_staging"
+INGESTION_TRIGGER = "1 minute"
+# Ingestion automatica (opzionale, PROVA_INGESTION=1): il SparkBuilder condiviso avvia lo streaming dalla
+# cartella di drop appena creato, così le pagine mostrano i nuovi file entro un trigger
+INGESTION_ENABLED = os.environ.get("PROVA_INGESTION", "") not in ("", "0")
+# Campi del fingerprint che identificano il file sorgente; "batches" conta i micro-batch aggiunti allo snapshot.
+# "layout" è la versione della struttura dello snapshot: cambiandola gli snapshot esistenti vengono ricostruiti
+FINGERPRINT_KEYS = ("size", "mtime", "sha256", "layout")
+SNAPSHOT_LAYOUT = 3
+PATH_MONUMENT = "C:\\Users\\ste\\Desktop\\Monument.csv"
+EARTH_RADIUS_KM = 6371.0
+# Cartella degli artefatti del modello di sentiment (vettorizzatore + classificatore per versione del dataset)
+PATH_MODELS = "C:\\Users\\ste\\Desktop\\models"
+# Recensioni con il sentiment predetto accanto al testo, salvate accanto allo snapshot
+SCORED_DIR = "_scored"
+# Servizio locale di classificazione del sentiment
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+# Numero di parole e tag mostrati nelle word cloud della Homepage
+WORDCLOUD_SIZE = 200
+# Strumentazione delle query (opzionale): attiva impostando la variabile d'ambiente PROVA_PROFILING=1
+PROFILING_ENV = "PROVA_PROFILING"
+PROFILING_LOG = "query_profile.jsonl"
+# Cache dei risultati delle query: livello su disco dentro lo snapshot (con il suo limite) e limiti del livello
+# in memoria
+RESULTS_DIR = "_results"
+RESULT_CACHE_MAX_DISK_BYTES = 1024 * 1024 * 1024
+RESULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+RESULT_CACHE_MAX_ENTRIES = 256
+RESULT_CACHE_MAX_ENTRY_BYTES = 64 * 1024 * 1024
+# Sessione Spark unica per il processo Streamlit: pagine e sessioni condividono un pool FAIR,
+# l'ingestion ha un pool separato con una quota minima garantita
+APP_NAME = "BigDataProject"
+FAIR_SCHEDULER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fairscheduler.xml")
+SCHEDULER_POOL = "streamlit"
+INGESTION_POOL = "ingestion"
+# Thread con cui le pagine lanciano insieme le proprie query sulla sessione condivisa
+QUERY_THREADS = 8
+# Limiti dei trasferimenti dalla JVM al driver Python, per singola chiamata
+TRANSFER_MAX_ROWS = 100_000
+TRANSFER_MAX_BYTES = 64 * 1024 * 1024
+TRANSFER_CHUNK_ROWS = 10_000
+# Corpus per l'addestramento del modello di sentiment sul driver
+TRANSFER_TRAINING_MAX_BYTES = 1024 * 1024 * 1024
+ARROW_BATCH_ROWS = 10_000
+DRIVER_MAX_RESULT_SIZE = "1g"
+# Punti oltre i quali mappe e grafici ricevono dati aggregati
+MAP_MAX_POINTS = 5_000
+CHART_MAX_POINTS = 1_000
+# Modalità approssimata (opzionale, PROVA_APPROXIMATE=1): sketch salvati accanto allo snapshot e campionamento
+APPROXIMATE_MODE = os.environ.get("PROVA_APPROXIMATE", "") not in ("", "0")
+SKETCHES_DIR = "_sketches"
+HLL_PRECISION = 14
+SKETCH_TOP_K = 2000
+# Gli intervalli riportati con i risultati approssimati sono al 95%
+SKETCH_Z = 1.96
+SAMPLE_FRACTION = 0.05
+SAMPLE_MIN_ROWS = 2000
+# Dataset in cache diviso in colonne calde (codici interi dei dizionari) e fredde (testi, lette dallo snapshot),
+# collegate da Review_Id. I dizionari sono salvati accanto allo snapshot
+REVIEW_ID = "Review_Id"
+DICTIONARIES_DIR = "_dictionaries"
+# Oltre questo numero di righe i testi vengono presi con un join invece che con un filtro sugli id
+COLD_LOOKUP_MAX_IDS = 10_000
+# Tag più frequenti con un bit nella maschera Tags_Mask (un long, senza usare il bit di segno)
+TAG_MASK_BITS = 63
+# Indice invertito delle recensioni per la ricerca full-text (BM25), salvato accanto allo snapshot.
+# Row group piccoli: la ricerca di un termine legge solo i blocchi che lo contengono
+SEARCH_INDEX_DIR = "_search_index"
+SEARCH_BM25_K1 = 1.2
+SEARCH_BM25_B = 0.75
+SEARCH_LIMIT = 20
+SEARCH_ROW_GROUP_BYTES = 1024 * 1024
+SEARCH_ROW_GROUP_ROWS = 50_000
+# Motore delle query: "spark" (predefinito) oppure "pandas" per installazioni piccole, sullo snapshot Parquet
+QUERY_ENGINE = os.environ.get("PROVA_ENGINE", "spark")
 
 # Solo gli indirizzi inglesi sono costituiti in modo alternativo
 def estraiCitta(indirizzo, country):
@@ -20,21 +113,46 @@ def estraiCitta(indirizzo, country):
         return indirizzo_split[city_index]
 
 
+def dataset_fingerprint(path, chunk_size=1 << 20):
+    # Identifica una versione del file sorgente tramite dimensione, data di modifica e hash del contenuto
+    stat = os.stat(path)
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha.hexdigest(), "layout": SNAPSHOT_LAYOUT}
+
+
+def read_fingerprint(snapshot_path):
+    try:
+        with open(os.path.join(snapshot_path, FINGERPRINT_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_fingerprint(snapshot_path, fingerprint):
+    with open(os.path.join(snapshot_path, FINGERPRINT_FILE), "w") as f:
+        json.dump(fingerprint, f)
+
+
+def is_snapshot_valid(snapshot_path, fingerprint, keys=FINGERPRINT_KEYS):
+    saved = read_fingerprint(snapshot_path)
+    if saved is None:
+        return False
+    return all(saved.get(key) == fingerprint.get(key) for key in keys)
+
+
+# Ricevono i pandas DataFrame già limitati alle prime N voci da QueryManager
 def get_word_frequencies_dict(word_counts_df):
-    word_frequencies_dict = {}
-    for row in word_counts_df.collect():
-        word_frequencies_dict[row['word']] = row['Frequency']
-    return word_frequencies_dict
+    return dict(zip(word_counts_df['word'], word_counts_df['Frequency']))
 
 
 def get_tags_frequencies_dict(tags_df):
-    word_frequencies_dict = {}
-    for row in tags_df.collect():
-        word_frequencies_dict[row['word']] = row['count']
-    return word_frequencies_dict
+    return dict(zip(tags_df['word'], tags_df['count']))
 
 def haversine(lat1, lon1, lat2, lon2):
-    R = 6371.0  # Raggio medio della Terra in chilometri
+    R = EARTH_RADIUS_KM  # Raggio medio della Terra in chilometri
 
     # Converti le coordinate da gradi a radianti
     lat1 = math.radians(lat1)
@@ -54,15 +172,33 @@ def haversine(lat1, lon1, lat2, lon2):
     return distance
 
 
+# Stessa formula di haversine su array NumPy: con il broadcasting calcola intere matrici di distanze in una volta
+def haversine_vectorized(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+# Le stopwords vengono lette da NLTK una sola volta per processo
+@lru_cache(maxsize=None)
+def get_stop_words():
+    return frozenset(stopwords.words('english'))
+
+
+PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation)
+
+
 def preprocess(text):
     # Rimuovi la punteggiatura
-    text = text.translate(str.maketrans('', '', string.punctuation))
+    text = text.translate(PUNCTUATION_TABLE)
 
     # Tokenizzazione
     tokens = word_tokenize(text)
 
     # Rimuovi le stopwords
-    stop_words = set(stopwords.words('english'))
+    stop_words = get_stop_words()
     tokens = [word for word in tokens if word.lower() not in stop_words]
 
     return tokens
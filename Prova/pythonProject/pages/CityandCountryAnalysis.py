@@ -1,17 +1,18 @@
 import plotly.express as px
 import streamlit as st
 
-from Backend import SparkBuilder
+from Backend import getSparkBuilder
+from Profiling import iniziaPagina, pannelloTempi
 
 
-@st.cache_resource
 def getSpark():
-    return SparkBuilder("appName")
+    return getSparkBuilder()
 
 
 def main():
     with st.spinner('Caricamento in corso, Attendere Prego...'):
         spark = getSpark()
+        iniziaPagina(spark, "CityandCountryAnalysis")
         countryInformation = spark.query.countryInformation().toPandas()
         mostused, leastused = spark.query.mostLeastUsedWordsByCity()
         totalNationality = spark.query.getReviewerNationality().toPandas()
@@ -38,6 +39,17 @@ def main():
                                barmode="stack")
     st.plotly_chart(totalposnegreview, use_container_width=True, theme="streamlit")
 
+    # Le stesse recensioni classificate dal modello di sentiment (calcolate offline con 'python Sentiment.py score')
+    st.subheader("Predicted Positive and Negative Review for each City")
+    try:
+        with st.spinner("Loading predicted sentiment..."):
+            predicted = spark.query.predictedSentimentByCity().toPandas()
+        predictedchart = px.bar(predicted, y=["Predicted_Negative", "Predicted_Positive"], x="City_Hotel",
+                                orientation="v", barmode="stack")
+        st.plotly_chart(predictedchart, use_container_width=True, theme="streamlit")
+    except Exception as e:
+        st.warning(f"Predicted sentiment not available: {e}")
+
     st.divider()
 
     col3, col4 = st.columns(2)
@@ -55,5 +67,29 @@ def main():
     totalposnegreview = px.bar(totalNationality, y="Different_Nationality", x="City_Hotel", orientation="v")
     st.plotly_chart(totalposnegreview, use_container_width=True, theme="streamlit")
 
+    st.divider()
+
+    st.subheader("Reviews by Trip Type")
+    tags = sorted(tag for tag in spark.query.getTags() if tag)
+    col5, col6 = st.columns(2)
+    with col5:
+        selected = st.multiselect("Tags", tags, default=[tag for tag in ("Leisure trip", "Couple") if tag in tags])
+    with col6:
+        city = st.selectbox("City", ["All"] + spark.query.getCityHotel())
+    if selected:
+        selected = tuple(sorted(selected))
+        if city == "All":
+            bycity = spark.query.tagStatistics(selected, by=("City_Hotel",)).toPandas()
+            tagchart = px.bar(bycity, x="City_Hotel", y="Avg_Reviewer_Score", hover_data=["Total_Reviews"])
+            st.plotly_chart(tagchart, use_container_width=True, theme="streamlit")
+        else:
+            tagstats = spark.query.tagStatistics(selected, city=city).first()
+            col7, col8 = st.columns(2)
+            col7.metric("Reviews", tagstats["Total_Reviews"])
+            col8.metric("Avarage Reviewer Score",
+                        round(tagstats["Avg_Reviewer_Score"], 2) if tagstats["Total_Reviews"] else "-")
+
+    pannelloTempi(spark)
+
 
 main()
@@ -2,26 +2,26 @@ import folium
 import streamlit as st
 from streamlit_folium import st_folium
 
-from Backend import SparkBuilder
+from Backend import getSparkBuilder
+from Profiling import iniziaPagina, pannelloTempi
 
 
-@st.cache_resource
 def getSpark():
-    return SparkBuilder("appName")
+    return getSparkBuilder()
 
 
 def getHotel(spark, country_name):
-    df = spark.query.getHotelsByCountry(country_name)
-    return [df[i][0] for i in range(len(df))]
+    return spark.query.getHotelsByCountry(country_name)
 
 
 with st.spinner("Loading data..."):
     spark = getSpark()
-    countrynames = spark.query.getCountryHotel()
-    listcountry = [countrynames[i][0] for i in range(len(countrynames))]
+    iniziaPagina(spark, "ComparasionHotel")
+    listcountry = spark.query.getCountryHotel()
 
 st.title("Comparasion Hotel")
 col1, col2 = st.columns(2)
+hotel1 = ""
 hotel2 = ""
 with col1:
     country1 = st.selectbox("Select Country Hotel 1", listcountry, index=None, key="country1")
@@ -111,3 +111,41 @@ if hotel2:
         st.subheader(f"Lasted Negative Review left {lrh2.iat[0, 3]} days ago")
         st.write(lrh2.iat[0, 2])
         st.divider()
+
+    # Recensioni dei due hotel classificate dal modello di sentiment
+    st.subheader("Predicted Sentiment")
+    try:
+        with st.spinner("Loading predicted sentiment..."):
+            predicted = spark.query.predictedSentimentByHotel().toPandas()
+        st.table(predicted[predicted["Hotel_Name"].isin([hotel1, hotel2])].reset_index(drop=True))
+    except Exception as e:
+        st.warning(f"Predicted sentiment not available: {e}")
+
+# Ricerca full-text sull'indice invertito: nessun job Spark per ogni ricerca
+st.header("Search Reviews")
+searchtext = st.text_input("Words to search in the reviews", key="searchtext")
+col6, col7, col8, col9 = st.columns(4)
+with col6:
+    searchhotel = st.selectbox("Hotel", ["All hotels"] + [h for h in (hotel1, hotel2) if h], key="searchhotel")
+with col7:
+    searchcity = st.selectbox("City", ["All cities"] + spark.query.getCityHotel(), key="searchcity")
+with col8:
+    datefrom = st.date_input("From", value=None, key="datefrom")
+with col9:
+    dateto = st.date_input("To", value=None, key="dateto")
+
+if searchtext:
+    with st.spinner("Searching..."):
+        found = spark.query.searchReviews(searchtext,
+                                          hotel=None if searchhotel == "All hotels" else searchhotel,
+                                          city=None if searchcity == "All cities" else searchcity,
+                                          date_from=datefrom, date_to=dateto)
+    if found.empty:
+        st.write("No reviews found")
+    for review in found.itertuples(index=False):
+        with st.expander(f"{review.Hotel_Name} ({review.City_Hotel}, {str(review.Review_Date)[:10]}) "
+                         f"- score {review.Score:.2f}"):
+            st.markdown(f"**Positive:** {review.Positive_Review}")
+            st.markdown(f"**Negative:** {review.Negative_Review}")
+
+pannelloTempi(spark)
@@ -1,20 +1,17 @@
 import folium
-import pandas as pd
 import streamlit as st
 from streamlit_folium import st_folium
 
-from Backend import SparkBuilder
-from Utility import haversine
+from Backend import getSparkBuilder
+from Profiling import iniziaPagina, pannelloTempi
 
 
-@st.cache_resource
 def getSpark():
-    return SparkBuilder("appName")
+    return getSparkBuilder()
 
 
 def getHotel(spark, cityname):
-    df = spark.query.getHotelsByCity(cityname)
-    return [df[i][0] for i in range(len(df))]
+    return spark.query.getHotelsByCity(cityname)
 
 
 def draw_path(m, start, end):
@@ -23,10 +20,10 @@ def draw_path(m, start, end):
 
 with st.spinner("Loading data..."):
     spark = getSpark()
-    citynames = spark.query.getCityHotel()
-    listcity = [citynames[i][0] for i in range(len(citynames))]
-    df_m = pd.read_csv('C:\\Users\\ste\\Desktop\\Monument.csv', delimiter=",")
-    print(df_m.columns)
+    iniziaPagina(spark, "DistanceFromMonument")
+    listcity = spark.query.getCityHotel()
+    spatialIndex = spark.query.getSpatialIndex()
+    df_m = spatialIndex.monuments
 
 st.title("How far is the hotel?")
 
@@ -47,14 +44,15 @@ if hotel:
     if hotel != "":
         with st.spinner(f"Searching data for {hotel}"):
             df_m = df_m[df_m['City'] == city]
-            print(df_m)
             h1, _ = spark.query.getH1H2statistic(hotel, hotel)
+            # Riga della matrice hotel x monumenti della città, calcolata in blocco una sola volta per città
+            matrix = spatialIndex.distanceMatrix(city)
+            distance = matrix.loc[hotel].to_dict() if hotel in matrix.index else {}
 
         st.divider()
 
         st.subheader("Distance from Monument")
         col1, col2 = st.columns(2)
-        distance = {}
 
         with col1:
             mapHotel = folium.Map(location=[h1["Latitude"], h1["Longitude"]], zoom_start=15)
@@ -66,9 +64,6 @@ if hotel:
                 folium.Marker(location=monument_location, popup=monument_name, icon=folium.Icon(color='green')).add_to(
                     mapHotel)
                 draw_path(mapHotel, monument_location, [h1["Latitude"], h1["Longitude"]])
-                distance_km = haversine(float(h1["Latitude"]), float(h1["Longitude"]), float(monument_location[0]),
-                                        float(monument_location[1]))
-                distance[monument_name] = distance_km
 
             st_folium(mapHotel, width=600, height=600, returned_objects=[])
 
@@ -79,3 +74,5 @@ if hotel:
                          unsafe_allow_html=True)
 
         st.divider()
+
+pannelloTempi(spark)
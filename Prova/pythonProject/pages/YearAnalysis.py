@@ -1,15 +1,16 @@
 import plotly.express as px
 import streamlit as st
 
-from Backend import SparkBuilder
+from Backend import getSparkBuilder
+from Profiling import iniziaPagina, pannelloTempi
 
 
-@st.cache_resource
 def getSpark():
-    return SparkBuilder("appName")
+    return getSparkBuilder()
 
 with st.spinner("Loading data... Please wait..."):
     spark = getSpark()
+    iniziaPagina(spark, "YearAnalysis")
     as_year, as_month = spark.query.getValutationByYearAMonth()
     tr_year, tr_month = spark.query.getTotalReviewByYearAMonth()
     awp_year, awn_month = spark.query.avarageNegativeAndPositveWordsForMonthAndYear()
@@ -71,4 +72,6 @@ st.title("Total Review between Season")
 
 fig = px.bar(correlationSeason, x='Season', y='Total', title='Total for Season',
              labels={'Season': 'Stagione', 'Total': 'Totale'})
-st.plotly_chart(fig)
\ No newline at end of file
+st.plotly_chart(fig)
+
+pannelloTempi(spark)
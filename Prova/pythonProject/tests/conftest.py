@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+# I moduli del progetto sono importati per nome, come fa Streamlit avviato da questa cartella
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def spark():
+    pyspark = pytest.importorskip("pyspark.sql")
+    session = pyspark.SparkSession.builder.master("local[1]").appName("tests") \
+        .config("spark.ui.enabled", "false").getOrCreate()
+    yield session
+    session.stop()
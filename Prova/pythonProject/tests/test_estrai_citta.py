@@ -0,0 +1,40 @@
+import pytest
+
+pytest.importorskip("pyspark")
+pytest.importorskip("nltk")
+
+from Backend import confrontaEstrazioneCitta, estraiCittaColumn
+from Utility import estraiCitta
+
+# (indirizzo, nazione): casi normali, Regno Unito con e senza 6BD, indici negativi
+INDIRIZZI = [
+    ("Stadhouderskade 12 Oud Zuid 1054 ES Amsterdam Netherlands", "Netherlands"),
+    ("Via Roberto Lepetit 1 Central Station 20124 Milan Italy", "Italy"),
+    ("Gran Via de les Corts Catalanes 570 Eixample 08011 Barcelona Spain", "Spain"),
+    ("20 Rue Saint Lazare 9th arr 75009 Paris France", "France"),
+    ("Landstra er Hauptstra e 28 03 Landstra e 1030 Vienna Austria", "Austria"),
+    ("1 Kings Cross Road Islington London WC1X 9DE United Kingdom", "United Kingdom"),
+    ("Inverness Terrace Westminster Borough London W2 6BD United Kingdom", "United Kingdom"),
+    # La nazione è la prima parola: l'indice della città è -1, cioè l'ultima parola
+    ("Netherlands Damrak 1 Amsterdam", "Netherlands"),
+    # "Kingdom" entro le prime quattro parole: indice negativo anche per il Regno Unito
+    ("W1 United Kingdom", "United Kingdom"),
+]
+
+
+def test_nativa_uguale_alla_funzione_python(spark):
+    df = spark.createDataFrame(INDIRIZZI, "Hotel_Address string, Country_Hotel string")
+    righe = df.select("Hotel_Address", "Country_Hotel", estraiCittaColumn().alias("City")).collect()
+    for row in righe:
+        assert row["City"] == estraiCitta(row["Hotel_Address"], row["Country_Hotel"]), row["Hotel_Address"]
+    assert confrontaEstrazioneCitta(df).count() == 0
+
+
+def test_nazione_assente_restituisce_null(spark):
+    indirizzo, country = "Piazza del Duomo 1 20121 Milano", "Italy"
+    with pytest.raises(ValueError):
+        estraiCitta(indirizzo, country)
+    df = spark.createDataFrame([(indirizzo, country)], "Hotel_Address string, Country_Hotel string")
+    assert df.select(estraiCittaColumn().alias("City")).first()["City"] is None
+    # Il confronto tratta l'eccezione della funzione Python come null: nessuna differenza
+    assert confrontaEstrazioneCitta(df).count() == 0
@@ -0,0 +1,33 @@
+import pytest
+
+pytest.importorskip("pyspark")
+pytest.importorskip("pyarrow")
+pytest.importorskip("nltk")
+
+from Backend import SparkBuilder
+from Benchmark import generateDataset
+from Encoding import COLD_COLUMNS
+from LocalEngine import METODI_PARITA, LocalBuilder, confrontaMotori
+
+
+# Stesso CSV sintetico per i due motori: Spark crea lo snapshot (e l'indice delle parole), pandas lo rilegge
+@pytest.fixture(scope="module")
+def motori(spark, tmp_path_factory):
+    cartella = tmp_path_factory.mktemp("parita")
+    csv_path = generateDataset(str(cartella / "reviews.csv"), 3000, seed=7)
+    snapshot = str(cartella / "snapshot")
+    spark_builder = SparkBuilder("tests", path=csv_path, snapshot=snapshot)
+    spark_builder.warmUp()
+    return spark_builder, LocalBuilder(path=csv_path, snapshot=snapshot)
+
+
+@pytest.mark.parametrize("metodo", METODI_PARITA)
+def test_stessi_risultati_sui_due_motori(motori, metodo):
+    assert confrontaMotori(*motori, metodi=[metodo]) == {}
+
+
+def test_testi_fuori_dal_dataset_locale(motori):
+    _, local = motori
+    assert not set(COLD_COLUMNS) & set(local.dataset.columns)
+    profili = local.query.getHotelProfiles()
+    assert profili["Positive"].notna().all() and profili["Negative"].notna().all()
@@ -0,0 +1,54 @@
+import threading
+import time
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("pyarrow")
+pytest.importorskip("pyspark")
+
+from ResultCache import ResultCache
+
+FINGERPRINT = {"size": 1, "mtime": 1, "sha256": "0" * 64, "layout": 2}
+
+
+def test_richieste_concorrenti_calcolano_una_volta(tmp_path):
+    cache = ResultCache(str(tmp_path / "results"))
+    chiamate = []
+
+    def compute():
+        chiamate.append(1)
+        time.sleep(0.2)
+        return pd.DataFrame({"x": [1, 2, 3]})
+
+    risultati = []
+    threads = [threading.Thread(target=lambda: risultati.append(cache.get(None, FINGERPRINT, "q", (), {}, compute)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(chiamate) == 1
+    assert all(r["x"].tolist() == [1, 2, 3] for r in risultati)
+    assert cache.stats()["miss"] == 1 and cache.stats()["memory"] == 7
+
+
+def test_livello_su_disco_limitato_in_byte(tmp_path):
+    cache = ResultCache(str(tmp_path / "results"), max_disk_bytes=1)
+    for i in range(3):
+        cache.get(None, FINGERPRINT, "q", (i,), {}, lambda: pd.DataFrame({"x": [i]}))
+
+    cartella = tmp_path / "results" / cache.version
+    # Resta solo l'ultima voce scritta (oltre al fingerprint della versione)
+    assert len([voce for voce in cartella.iterdir() if voce.is_dir()]) == 1
+
+
+def test_nuova_versione_rimuove_le_precedenti(tmp_path):
+    cache = ResultCache(str(tmp_path / "results"))
+    cache.get(None, FINGERPRINT, "q", (), {}, lambda: pd.DataFrame({"x": [1]}))
+    vecchia = cache.version
+    cache.get(None, dict(FINGERPRINT, batches=1), "q", (), {}, lambda: pd.DataFrame({"x": [2]}))
+
+    assert [voce.name for voce in (tmp_path / "results").iterdir()] == [cache.version]
+    assert cache.version != vecchia
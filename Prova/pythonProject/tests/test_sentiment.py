@@ -0,0 +1,29 @@
+import pytest
+
+pytest.importorskip("pyspark")
+
+from Sentiment import buildSentimentPipeline, predictReviews, scoreDataset
+
+RECENSIONI = [
+    ("Great location and very friendly staff", 1), ("Lovely room and excellent breakfast", 1),
+    ("Friendly staff great breakfast", 1), ("Excellent location lovely view", 1),
+    ("Dirty room and rude staff", 0), ("Noisy room terrible breakfast", 0),
+    ("Rude reception dirty bathroom", 0), ("Terrible noise and dirty carpet", 0),
+]
+
+
+# La classificazione in batch e quella delle singole recensioni passano dalla stessa pipeline:
+# lo stesso testo deve ricevere la stessa classe e la stessa confidenza
+def test_batch_e_singola_recensione_coincidono(spark):
+    model = buildSentimentPipeline(num_features=1 << 10).fit(
+        spark.createDataFrame(RECENSIONI, "Review string, Sentiment int"))
+    testi = [testo for testo, _ in RECENSIONI]
+    df = spark.createDataFrame([(i, testo, "No Negative") for i, testo in enumerate(testi)],
+                               "Id long, Positive_Review string, Negative_Review string")
+    righe = scoreDataset(df, model).orderBy("Id").collect()
+
+    for row, (sentiment, confidence) in zip(righe, predictReviews(model, spark, testi)):
+        assert row["Positive_Sentiment"] == sentiment
+        assert row["Positive_Confidence"] == pytest.approx(confidence)
+        # I segnaposto non vengono classificati
+        assert row["Negative_Sentiment"] is None and row["Negative_Confidence"] is None